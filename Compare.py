@@ -0,0 +1,222 @@
+"""============================================================================
+Compare the fast Alpha estimators and the wavelet engine against the ChiSq fit on the raw data,
+reporting how far each deviates and how long it takes. Used to decide which
+tags to screen with a fast estimator before running the full fit. With -k the
+PCA refit cadences are compared against refitting every row instead.
+
+Contents:
+- main
+- Compare Alpha
+- Compare All
+- Compare PCA
+
+Author: Joseph Walker j.j.walker@durham.ac.uk
+============================================================================"""
+
+#Pandas for data import and management
+import pandas as pd
+import numpy as np
+
+import sys, getopt
+import os
+import time
+import warnings
+
+from codes import DatManipulation as DatM
+from codes import Fourier
+from codes import Misc
+from codes import CalcStats
+from codes import PCA
+
+import Vars
+
+#CalcStats and PCA only import their siblings when run from the app
+CalcStats.Misc = Misc
+PCA.Misc = Misc
+
+#Global variables
+DirRaw = "data"+os.sep+"RawData"
+DatM.FileSuffix = Vars.FileSuffix
+Fourier.Alpha_MinFreq = Vars.Alpha_MinFreq
+Fourier.Alpha_Spectrum = Vars.Alpha_Spectrum
+Fourier.Alpha_SDFTAnchor = Vars.Alpha_SDFTAnchor
+Fourier.Alpha_AnalyticFit = Vars.Alpha_AnalyticFit
+Fourier.Alpha_LMMaxIter = Vars.Alpha_LMMaxIter
+PCA.Rolling_WindowUnit = Vars.Rolling_WindowUnit
+PCA.Rolling_Window = Vars.Rolling_Window
+PCA.PCA_Engine = Vars.PCA_Engine
+PCA.PCA_Recompute = Vars.PCA_Recompute
+PCA.PCA_BatchChunk = Vars.PCA_BatchChunk
+PCA.PCA_Float32 = Vars.PCA_Float32
+
+def main(argv):
+	''' Take inputs from command line,
+	argv: Command line input,
+	Return,
+	Features: List of feature names, all raw data by default
+	Estimators: List of estimators, or "Wavelet" for the wavelet engine, to compare with the ChiSq fit
+	Cadences: List of PCA refit cadences to compare with refitting every row, empty for the Alpha comparison
+	'''
+	#Defualt parameters
+	Features = DatM.GlobDirectory(DirRaw)
+	Estimators = ["LogLog", "LM", "Wavelet"]
+	Cadences = []
+	try:
+		opts, args = getopt.getopt(argv,"hf:e:k:",["Features=","Estimators=","RefitEvery="])
+	except getopt.GetoptError:
+		print('python Compare.py -f <name,name> -e <LogLog,LM,Wavelet> -k <1,4,16>')
+		sys.exit(2)
+	for opt, arg in opts:
+		if opt == '-h':
+			print('python Compare.py -f <name,name> -e <LogLog,LM,Wavelet> -k <1,4,16>')
+			sys.exit()
+		elif opt in ("-f", "--Features"):
+			Features = arg.split(",")
+		elif opt in ("-e", "--Estimators"):
+			Estimators = arg.split(",")
+		elif opt in ("-k", "--RefitEvery"):
+			Cadences = [int(k) for k in arg.split(",")]
+	return Features, Estimators, Cadences
+
+#######################
+# Compare Alpha
+#######################
+
+def RunAlpha(data, Data_i_Name, Estimator):
+	''' Run the Alpha anaylsis of a feature with one estimator,
+	data: Dataframe of the feature
+	Data_i_Name: Feature name
+	Estimator: Fourier.Alpha_Estimator mode, or "Wavelet" for the wavelet engine
+	Return,
+	Alphas: Array of [Alpha, Error] rows
+	Time: Run time in seconds
+	'''
+	WindowParameters = CalcStats.CalcStats(data[Data_i_Name])
+	units = Misc.CalcUnits(WindowParameters["Rate"],WindowParameters["RateUnit"])
+	window = Misc.WindowSize(WindowParameters["Rate"], WindowParameters["RateUnit"], Vars.WindowUnit, Vars.WindowN)
+	errs = Misc.errCalculation(data, WindowParameters["RateUnit"], True)
+	Fourier.Alpha_Engine = "Wavelet" if Estimator == "Wavelet" else "FFT"
+	Fourier.Alpha_Estimator = Estimator
+	T0 = time.time()
+	Alphasdf = Fourier.AlphasProgress(data[Data_i_Name].values, window, errs, units, Data_i_Name)
+	return Alphasdf.values, time.time()-T0
+
+def CompareAlpha(Data_i_Name, Estimators):
+	''' Compare estimators with the ChiSq fit for one feature,
+	Data_i_Name: Feature name
+	Estimators: List of estimators
+	Return,
+	Rows: List of dictionaries of the comparison statistics
+	'''
+	data = DatM.LoadData(DirRaw, Data_i_Name)
+	Ref, RefTime = RunAlpha(data, Data_i_Name, "ChiSq")
+	Rows = []
+	for Estimator in Estimators:
+		Alphas, Time = RunAlpha(data, Data_i_Name, Estimator)
+		#Windows fitted by both
+		Mask = np.isfinite(Ref[:,1]) & np.isfinite(Alphas[:,1])
+		Diff = Alphas[Mask,0] - Ref[Mask,0]
+		Rows.append({
+			"Feature" : Data_i_Name,
+			"Estimator" : Estimator,
+			"Windows" : int(np.sum(Mask)),
+			"Speedup" : RefTime/Time,
+			"MeanDiff" : np.mean(Diff),
+			"MeanAbsDiff" : np.mean(np.abs(Diff)),
+			"MaxAbsDiff" : np.max(np.abs(Diff)),
+			"Corr" : np.corrcoef(Alphas[Mask,0], Ref[Mask,0])[0,1],
+			#Fraction of windows outside the ChiSq error
+			"Outside1Sigma" : np.mean(np.abs(Diff) > Ref[Mask,1]),
+		})
+	return Rows
+
+#######################
+# Compare All
+#######################
+
+def CompareAll(Features, Estimators):
+	''' Compare estimators with the ChiSq fit for all features,
+	Features: List of feature names
+	Estimators: List of estimators
+	Return,
+	df: Dataframe of the comparison statistics
+	'''
+	Rows = []
+	for Data_i_Name in Features:
+		Rows += CompareAlpha(Data_i_Name, Estimators)
+		print("Completed %s" % Data_i_Name)
+	return pd.DataFrame(Rows)
+
+#######################
+# Compare PCA
+#######################
+
+def RunPCA(df, NPCA, window, RefitEvery):
+	''' Run the PCA anaylsis with one refit cadence,
+	df: Dataframe of the features
+	NPCA: The dimensionality of the model used
+	window: The number of points to use in the rolling window
+	RefitEvery: PCA.PCA_RefitEvery
+	Return,
+	Ts: The t squared hotelling statistic df
+	Qs: The Q resisduals statistic df
+	Time: Run time in seconds
+	'''
+	PCA.PCA_RefitEvery = RefitEvery
+	T0 = time.time()
+	_, Ts, Qs, _ = PCA.PCA(df, NPCA, window)
+	return Ts, Qs, time.time()-T0
+
+def ComparePCA(Features, Cadences):
+	''' Compare PCA refit cadences with refitting every row on the features together,
+	Features: List of feature names
+	Cadences: List of refit cadences
+	Return,
+	df: Dataframe of the comparison statistics
+	'''
+	df, _ = DatM.PCALOAD(DirRaw, Features)
+	NPCA, AlphaLim, _ = Misc.GetOptimzed(Vars.PCA_FittedParams, "Raw", "", Vars.DefaultMetric, Features)
+	WindowParameters = CalcStats.CalcStats(df.iloc[:,0])
+	window = Misc.WindowSize(WindowParameters["Rate"], WindowParameters["RateUnit"], Vars.WindowUnit, Vars.WindowN)
+	dtMeasure = Misc.timedeltaOneUnit(WindowParameters["Rate"], WindowParameters["RateUnit"])
+
+	RefTs, RefQs, RefTime = RunPCA(df, NPCA, window, 1)
+	RefFlags = (RefTs.iloc[:,0] < AlphaLim) & (RefQs.iloc[:,0] < AlphaLim)
+	RefRegions = PCA.PCARegionsCollect(RefTs, RefQs.copy(), dtMeasure, AlphaLim, NPCA, 0)[0]
+	Rows = []
+	for RefitEvery in Cadences:
+		Ts, Qs, Time = RunPCA(df, NPCA, window, RefitEvery)
+		Flags = (Ts.iloc[:,0] < AlphaLim) & (Qs.iloc[:,0] < AlphaLim)
+		Regions = PCA.PCARegionsCollect(Ts, Qs.copy(), dtMeasure, AlphaLim, NPCA, 0)[0]
+		TsDiff = np.abs(Ts.values - RefTs.values)
+		QsDiff = np.abs(Qs.values - RefQs.values)
+		Rows.append({
+			"RefitEvery" : RefitEvery,
+			"Time" : Time,
+			"Speedup" : RefTime/Time,
+			"TsMeanAbsDiff" : np.mean(TsDiff[:,0]),
+			"TsMaxAbsDiff" : np.max(TsDiff[:,0]),
+			"QsMeanAbsDiff" : np.mean(QsDiff[:,0]),
+			"QsMaxAbsDiff" : np.max(QsDiff[:,0]),
+			#Largest change of any individual feature P value
+			"FeatureMaxAbsDiff" : max(np.max(TsDiff[:,1:]), np.max(QsDiff[:,1:])),
+			#Fraction of rows flagged differently at AlphaLim
+			"FlagMismatch" : np.mean(Flags != RefFlags),
+			"Regions" : Regions.shape[0],
+			"RefRegions" : RefRegions.shape[0],
+		})
+		print("Completed RefitEvery %s" % RefitEvery)
+	return pd.DataFrame(Rows)
+
+if __name__ == "__main__":
+	warnings.simplefilter("ignore")
+	Features, Estimators, Cadences = main(sys.argv[1:])
+	if len(Cadences) > 0:
+		df = ComparePCA(Features, Cadences)
+		with pd.option_context("display.width", 200, "display.max_columns", None):
+			print(df.round(4).to_string(index=False))
+		sys.exit()
+	df = CompareAll(Features, Estimators)
+	with pd.option_context("display.width", 200, "display.max_columns", None):
+		print(df.round(4).to_string(index=False))
+		print(df.groupby("Estimator").mean(numeric_only=True).round(4).to_string())
@@ -37,6 +37,18 @@ FileSuffix = "xlsx"                     #"xlsx"
 SaveFigs = 0                            #0
 # Save cache files 0/1 int
 SaveCache = 1                           #1
+# Grid intervals of the Fourier tab spectrogram cache, 0 computes every slider window * int
+Fourier_CacheGrid = 20                  #20
+# Most frequency bins kept per cached spectrum, about the plotted resolution, 0 keeps every frequency * int
+Fourier_CachePoints = 500               #500
+# Megabytes of spectrogram caches kept in memory, least recently used are dropped * float
+Fourier_CacheMB = 64                    #64
+
+### Run all ###
+# Worker processes used by the run all buttons, 0 for all cores * int
+NWorkers = 0                            #0
+# Windows fitted before each chunk of a long Alpha series to re-establish the warm start * int
+Alpha_BurnIn = 50                       #50
 
 
 #######################
@@ -53,6 +65,25 @@ WindowN = 1                                #1
 ### Alpha Hyperparameters ###
 #The minimum frequecy used in power spectrum fit. * float
 Alpha_MinFreq = 0                          #0
+#Spectra of the windows, "Batch" FFTs or "Sliding" DFT updates. * str
+Alpha_Spectrum = "Batch"                   #"Batch"
+#Steps between full FFTs re-anchoring the sliding DFT. * int
+Alpha_SDFTAnchor = 256                     #256
+#Fit pink noise with closed form derivatives, 0 for numerical derivatives. * int
+Alpha_AnalyticFit = 1                      #1
+#Number of log spaced frequency bins averaged before fitting, 0 fits every frequency. * int
+Alpha_NBins = 0                            #0
+#Alpha engine, "FFT" fits each window spectrum, "Wavelet" uses the Haar wavelet variance. * str
+Alpha_Engine = "FFT"                       #"FFT"
+#Fit every Alpha_Hop-th window, rows between fits are filled. * int
+Alpha_Hop = 1                              #1
+#Filling of rows between fits, "ffill" or "interpolate". * str
+Alpha_HopFill = "ffill"                    #"ffill"
+#Alpha estimator, "ChiSq" fits each window in turn, "LM" fits all windows together,
+#"LogLog" is a fast log-log linear regression for screening. * str
+Alpha_Estimator = "ChiSq"                  #"ChiSq"
+#Maximum iterations of the "LM" batch fit. * int
+Alpha_LMMaxIter = 100                      #100
 
 ### BOCPD Hyperparameters ###
 # Drop off tolerance for long tails * float
@@ -61,6 +92,10 @@ BOCPD_tol = 1e-10                          #1e-10
 BOCPD_haz = 1/(200)                        #1/200
 # Error scaling for datapoint errors * float
 BOCPD_errsScale = 1                        #2
+# Run the recursion in log space and store log10 probabilities 0/1 int
+BOCPD_LogSpace = 1                         #1
+# Max run length hypotheses kept per step in "Run all", 0 for exact * int
+BOCPD_MaxHypotheses = 0                    #0
 
 ### PCA Hyperparameters ###
 #Set by RETUNING...
@@ -70,6 +105,16 @@ PCA_FittedParams = {
 		"BOCPD": None,
 		"None" : {"NPCA" : 1, "AlphaLim" : 1e-2, "Thresh" : -1}, 	
 }
+#Rows scored by each model before refitting, 1 refits every row. * int
+PCA_RefitEvery = 1                         #1
+#PCA engine, "sklearn" refits every row, "Rolling" updates a running covariance, "Batch" decomposes all windows together. * str
+PCA_Engine = "sklearn"                     #"sklearn"
+#Running covariance updates between exact recomputes. * int
+PCA_Recompute = 1000                       #1000
+#Most rows scored per batched decomposition of the "Batch" engine, fewer when the window is shorter. * int
+PCA_BatchChunk = 2048                      #2048
+#Store the PCA results in single precision 0/1 int
+PCA_Float32 = 0                            #0
 ### Rates Hyperparameters ###
 Rolling_WindowUnit = "week"
 Rolling_Window = 1
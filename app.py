@@ -57,6 +57,7 @@ import scipy
 
 #For moving data around as child
 import json
+import hashlib
 
 #Command lines
 import sys, getopt
@@ -74,6 +75,7 @@ from codes import BOCPD
 from codes import PCA
 from codes import Misc
 from codes import CalcStats
+from codes import Workers
 #Graph code
 from codes import DashPlots
 from codes import Graphing
@@ -113,16 +115,28 @@ WindowN =                   Vars.WindowN
 #Alpha Hyperparameters
 Alpha_MinFreq =             Vars.Alpha_MinFreq
 Fourier.Alpha_MinFreq = Alpha_MinFreq
+Fourier.Alpha_Spectrum =    Vars.Alpha_Spectrum
+Fourier.Alpha_SDFTAnchor =  Vars.Alpha_SDFTAnchor
+Fourier.Alpha_AnalyticFit = Vars.Alpha_AnalyticFit
+Fourier.Alpha_Estimator =   Vars.Alpha_Estimator
+Fourier.Alpha_NBins =       Vars.Alpha_NBins
+Fourier.Alpha_Hop =         Vars.Alpha_Hop
+Fourier.Alpha_HopFill =     Vars.Alpha_HopFill
+Fourier.Alpha_Engine =      Vars.Alpha_Engine
+Fourier.Alpha_LMMaxIter =   Vars.Alpha_LMMaxIter
 
 #Set DefaultParams
 BOCPD_tol =                 Vars.BOCPD_tol
 BOCPD_haz =                 Vars.BOCPD_haz
 BOCPD_MaxSeqLength =        Vars.BOCPD_MaxSeqLength
 BOCPD_errsScale =           Vars.BOCPD_errsScale
+BOCPD_LogSpace =            Vars.BOCPD_LogSpace
+BOCPD_MaxHypotheses =       Vars.BOCPD_MaxHypotheses
 
 BOCPD.BOCPD_tol = BOCPD_tol
 BOCPD.BOCPD_MaxSeqLength = BOCPD_MaxSeqLength
 BOCPD.BOCPD_haz = BOCPD_haz
+BOCPD.BOCPD_LogSpace = BOCPD_LogSpace
 
 #PCA Hyperparameters
 PCA_FittedParams =          Vars.PCA_FittedParams
@@ -132,12 +146,31 @@ PCA_WindowN = WindowN
 #Rolling window
 PCA.Rolling_WindowUnit =    Vars.Rolling_WindowUnit
 PCA.Rolling_Window =        Vars.Rolling_Window
+PCA.PCA_Engine =            Vars.PCA_Engine
+PCA.PCA_Recompute =         Vars.PCA_Recompute
+PCA.PCA_RefitEvery =        Vars.PCA_RefitEvery
+PCA.PCA_BatchChunk =        Vars.PCA_BatchChunk
+PCA.PCA_Float32 =           Vars.PCA_Float32
 
 DatM.FileSuffix =           Vars.FileSuffix
 Graphing.BOCPD_errsScale =  Vars.BOCPD_errsScale
 
 SaveFigs =                  Vars.SaveFigs
 SaveCache =                 Vars.SaveCache
+Fourier_CacheGrid =         Vars.Fourier_CacheGrid
+Fourier_CachePoints =       Vars.Fourier_CachePoints
+Fourier_CacheMB =           Vars.Fourier_CacheMB
+FourierDir =                "data"+os.sep+"FourierData"
+#Spectrogram caches already loaded this session, least recently used first
+Spectrograms = {}
+
+#Run all worker pool
+Workers.NWorkers =          Vars.NWorkers
+Workers.WindowUnit =        WindowUnit
+Workers.WindowN =           WindowN
+Workers.BOCPD_errsScale =   BOCPD_errsScale
+Workers.BOCPD_MaxHypotheses = BOCPD_MaxHypotheses
+Workers.Alpha_BurnIn =      Vars.Alpha_BurnIn
 
 #######################
 # Read In Markdown
@@ -218,6 +251,191 @@ def LoadDataAfterDropdowns(DataDirectory, Data_i_Name, inter=False):
 	else:
 		return 0
 
+def UpdateBOCPD(data, Data_i_Name, RateUnit, BOCPDDirectory):
+	'''
+    Run the online BOCPD detector over rows not yet processed and append them to the stored results,
+
+            Parameters:
+                    data (pd.DataFrame): Raw data with columns [feature, error]
+                    Data_i_Name (str): File name
+					RateUnit (str): The units of the sample rate
+					BOCPDDirectory (str): BOCPD directory
+
+            Returns:
+                    BOCPDdf (pd.DataFrame): The stored BOCPD run length posterior
+    '''
+	State = DatM.LoadState(BOCPDDirectory, Data_i_Name)
+	Resume = State != None
+	if Resume == False:
+		Detector = BOCPD.OnlineBOCPD()
+		New = data
+	else:
+		Detector = BOCPD.OnlineBOCPD.from_state(State)
+		New = data[data.index > pd.Timestamp(Detector.LastTime)]
+	#Run lengths beyond those stored in a row
+	Fill = -np.inf if Detector.Log == True else 0.0
+	if New.shape[0] == 0:
+		return DatM.LoadData(BOCPDDirectory, Data_i_Name, False).fillna(Fill)
+
+	Values = New[Data_i_Name].values
+	#Error estimated on mean devition beween points
+	Errors = Misc.errCalculation(New, RateUnit, False)
+	if Resume == False:
+		Index = New.index[1:]
+	else:
+		#Difference against the last processed raw point
+		Values = np.append(State["LastValue"], Values)
+		Errors = np.append(State["LastError"], Errors)
+		Index = New.index
+	errs = np.sqrt(Errors[1:]**2+Errors[:-1]**2)
+	R = Detector.update(np.diff(Values), BOCPD_errsScale*errs, ["%s" % t for t in Index])
+	Detector.LastTime = "%s" % New.index[-1]
+
+	Ps = R.max()
+	if Detector.Log == True:
+		Ps = 10**Ps
+	BOCPDdf = pd.DataFrame(R.dense(r1=min(int(np.max(R.lengths(), initial=1)), BOCPD_MaxSeqLength)), index=Index)
+	Rmaxdf = pd.DataFrame(data={"R_Max":R.argmax(), "P":Ps}, index=Index)
+	if Resume == True:
+		#Only the new rows are written, merged with the workbook on loading
+		DatM.AppendData(BOCPDDirectory, Data_i_Name, BOCPDdf)
+		DatM.AppendData(BOCPDDirectory, Data_i_Name+"_R_Max", Rmaxdf)
+	else:
+		writer = pd.ExcelWriter("%s%s%s.xlsx" % (BOCPDDirectory, os.sep, Data_i_Name), mode="w")
+		BOCPDdf.to_excel(writer)
+		writer.save()
+
+		writer = pd.ExcelWriter("%s%s%s_R_Max.xlsx" % (BOCPDDirectory, os.sep, Data_i_Name), mode="w")
+		Rmaxdf.to_excel(writer)
+		writer.save()
+		DatM.RemoveAppended(BOCPDDirectory, Data_i_Name)
+		DatM.RemoveAppended(BOCPDDirectory, Data_i_Name+"_R_Max")
+
+	#Checkpoint once the results are stored
+	State = Detector.state()
+	State["LastValue"] = float(Values[-1])
+	State["LastError"] = float(Errors[-1])
+	DatM.SaveState(BOCPDDirectory, Data_i_Name, State)
+	if Resume == True:
+		return DatM.LoadData(BOCPDDirectory, Data_i_Name, False).fillna(Fill)
+	return BOCPDdf
+
+def StoredLogSpace(BOCPDdf, Data_i_Name, BOCPDDirectory):
+	'''
+    Whether a stored BOCPD run length posterior holds log10 probabilities,
+
+            Parameters:
+                    BOCPDdf (pd.DataFrame): The stored BOCPD run length posterior
+                    Data_i_Name (str): File name
+					BOCPDDirectory (str): BOCPD directory
+
+            Returns:
+                    Log (bool): T/F log10 probabilities
+    '''
+	State = DatM.LoadState(BOCPDDirectory, Data_i_Name)
+	if State != None:
+		return State.get("Log", False) == True
+	#Files without a checkpoint, probabilities are never negative
+	return bool((BOCPDdf.values < 0).any())
+
+def UpdateAlphas(data, Data_i_Name, RateUnit, units, window, AlphaDir):
+	'''
+    Fit the Alpha windows of rows not yet processed and append them to the stored results,
+
+            Parameters:
+                    data (pd.DataFrame): Raw data with columns [feature, error]
+                    Data_i_Name (str): File name
+					RateUnit (str): The units of the sample rate
+					units (float): The tranformation into frequency units
+					window (int): Number of data points in the window
+					AlphaDir (str): Alpha directory
+
+            Returns:
+                    Alphasdf (pd.DataFrame): The stored rolling window Alphas
+    '''
+	State = DatM.LoadState(AlphaDir, Data_i_Name)
+	Values = data[Data_i_Name].values
+	NPoints = len(Values)
+	#Error estimated on mean devition beween points
+	errs = Misc.errCalculation(data, RateUnit, True)
+	#Any change of the settings refits every window
+	Resume = State != None and State["Window"] == window and all(State.get(Key) == Value for Key, Value in Fourier.AlphasSettings().items())
+	if Resume == True:
+		NOld = int(np.sum(data.index <= pd.Timestamp(State["LastTime"])))
+		#Every window is fitted with the mean error of the rows of the last full fit, a changed history refits them
+		Resume = "errs" in State and np.isclose(Misc.errCalculation(data[data.index <= pd.Timestamp(State["errsTime"])], RateUnit, True), State["errs"], rtol=1e-9, atol=0)
+	if Resume == True:
+		errs = State["errs"]
+		errsTime = State["errsTime"]
+		if NOld >= NPoints:
+			return DatM.LoadData(AlphaDir, Data_i_Name)
+
+	if Resume == False:
+		Alphasdf = Workers.AlphasProgressParallel(Values, window, errs, units, Data_i_Name)
+		Alphasdf.index = data.index
+		Guess = None
+		errsTime = data.index[-1]
+	elif Fourier.Alpha_Engine == "Wavelet":
+		#Rerun over the new rows and the window before them
+		First = max(NOld-window, 0)
+		Alphasdf = Fourier.AlphasWavelet(Values[First:], window, Data_i_Name).iloc[NOld-First:]
+		Alphasdf.index = data.index[NOld:]
+		Alphasdf = pd.concat([DatM.LoadData(AlphaDir, Data_i_Name), Alphasdf])
+		Guess = State["Guess"]
+	else:
+		#Row p is fitted on the window Values[p-window:p], every Alpha_Hop-th window from the first
+		Hop = Fourier.Alpha_Hop
+		First = -(-(max(NOld, window) - window)//Hop)*Hop
+		PinkWindows = np.zeros((NPoints-NOld, 2, 2)) - np.inf
+		PinkWindows[max(window-NOld, 0):] = np.nan
+		Guess = State["Guess"]
+		if NPoints-window > First:
+			Fitted = Fourier.AlphasWindows(Values, window, errs, units, First, NPoints-window, Guess, Hop)
+			PinkWindows[First+window-NOld::Hop] = Fitted
+			Guess = Fitted[-1,0]
+		Alphasdf = Fourier.AlphasFrame(PinkWindows, Data_i_Name)
+		Alphasdf.index = data.index[NOld:]
+		Alphasdf = pd.concat([DatM.LoadData(AlphaDir, Data_i_Name), Alphasdf])
+		if Hop > 1:
+			#Rows after the last stored fit are filled from the new fits
+			Alphasdf = Fourier.FillHops(Alphasdf, Data_i_Name)
+
+	DatM.SaveState(AlphaDir, Data_i_Name, Fourier.AlphasState(Values, window, errs, units, data.index[-1], errsTime, Guess))
+	writer = pd.ExcelWriter("%s%s%s.xlsx" % (AlphaDir, os.sep, Data_i_Name), mode="w")
+	Alphasdf.to_excel(writer)
+	writer.save()
+	return Alphasdf
+
+def LoadSpectrogram(Values, Data_i_Name, units, errs):
+	'''
+    Load the spectrogram cache of a feature, recomputing it when the data or settings have changed,
+
+            Parameters:
+                    Values (np.array): Raw data values
+                    Data_i_Name (str): File name
+					units (float): The tranformation into frequency units
+					errs (float): Errors on the amplitudes
+
+            Returns:
+                    Cache (dict): Spectra and fits returned by Fourier.Spectrogram
+    '''
+	#Exact hash of the data and the settings the spectra depend on
+	Key = "%s %r %r %r %r %r %r" % (hashlib.sha1(np.ascontiguousarray(Values, dtype=float).tobytes()).hexdigest(), float(units), float(errs), float(Fourier.Alpha_MinFreq), int(Fourier.Alpha_NBins), int(Fourier_CacheGrid), int(Fourier_CachePoints))
+	Valid = lambda Cache: Cache != None and "Key" in Cache and str(Cache["Key"]) == Key
+	Cache = Spectrograms.pop(Data_i_Name, None)
+	if not Valid(Cache):
+		Cache = DatM.LoadArrays(FourierDir, Data_i_Name)
+	if not Valid(Cache):
+		Cache = Fourier.Spectrogram(Values, units, errs, Fourier_CacheGrid, Fourier_CachePoints)
+		Cache["Key"] = Key
+		DatM.SaveArrays(FourierDir, Data_i_Name, Cache)
+	Spectrograms[Data_i_Name] = Cache
+	#Drop the least recently used caches beyond Fourier_CacheMB, keeping the one in use
+	Bytes = lambda Cache: sum(np.asarray(Array).nbytes for Array in Cache.values())
+	while len(Spectrograms) > 1 and sum(Bytes(C) for C in Spectrograms.values()) > Fourier_CacheMB*1e6:
+		del Spectrograms[next(iter(Spectrograms))]
+	return Cache
+
 def toggle_modal(n1, n2, is_open):
 	'''
     Toggle info modal displays
@@ -2014,24 +2232,29 @@ def update_graph(jsonified_data, value, LinLog, sig):
 		units = Misc.CalcUnits(WindowParameters["Rate"],WindowParameters["RateUnit"])
 		if units == None:
 			return DashPlots.EmptyFig(FigHeightPX/2), json.dumps(CalcStats.CalcFourierStatsEmpty())
-		fftfreq, AmpSpec, _ = Fourier.FourierTransform(data[Data_i_Name].values, units)
+		#Error estimated on mean devition beween points
+		errs = Misc.errCalculation(data, WindowParameters["RateUnit"], True)	
+		Values = data[Data_i_Name].values
+		if Fourier_CacheGrid > 0:
+			#Nearest precomputed window to the slider
+			Cache = LoadSpectrogram(Values, Data_i_Name, units, errs)
+			FsAll, AsAll, _, _ = Fourier.LookupSpectrum(Cache, 0, len(Values))
+			fftfreq, AmpSpec, PPink, PPinkErrs = Fourier.LookupSpectrum(Cache, data.index.searchsorted(startval), data.index.searchsorted(endval, side="right"))
+		else:
+			FsAll, AsAll, _ = Fourier.FourierTransform(Values, units)
+			AsAll = AsAll[FsAll > 0]
+			fftfreq, AmpSpec, PPink, PPinkErrs = Fourier.SpectrumFit(data[startval:endval][Data_i_Name].values, units, errs)
 
 		if LinLog == 'Log':
-			MinValue = min(AmpSpec[fftfreq > 0])/10
-			MaxValue = max(AmpSpec[fftfreq > 0])*10
+			MinValue = min(AsAll)/10
+			MaxValue = max(AsAll)*10
 		if LinLog == 'Linear':
-			MaxValue = max(AmpSpec[fftfreq > 0])*2
+			MaxValue = max(AsAll)*2
 			MinValue = 0
-		
-		fftfreq, AmpSpec, Series_phase = Fourier.FourierTransform(data[startval:endval][Data_i_Name].values, units)
-		
-		#Error estimated on mean devition beween points
-		errs = Misc.errCalculation(data, WindowParameters["RateUnit"], True)	
-		PPink, PPinkErrs = Fourier.FitPink(fftfreq[fftfreq > Alpha_MinFreq], AmpSpec[fftfreq > Alpha_MinFreq], errs, units)
 
-		FigAlpha = DashPlots.CreateFFTFig(fftfreq[fftfreq > 0], AmpSpec[fftfreq > 0],PPink, FigHeightPX/2,[MinValue, MaxValue], Alpha_MinFreq, LinLog, Data_i_Name)
+		FigAlpha = DashPlots.CreateFFTFig(fftfreq, AmpSpec, PPink, FigHeightPX/2,[MinValue, MaxValue], Alpha_MinFreq, LinLog, Data_i_Name)
 
-		FourierStats = CalcStats.CalcFourierStats(fftfreq[fftfreq > 0], AmpSpec[fftfreq > 0],PPink, PPinkErrs) 
+		FourierStats = CalcStats.CalcFourierStats(fftfreq, AmpSpec, PPink, PPinkErrs) 
 
 		if SaveFigs == 1:
 			NameDate =  "_%s_%s" % (data.index[0].strftime("%d%m%Y"),data.index[-1].strftime("%d%m%Y"))
@@ -2154,16 +2377,11 @@ def LoadAlphasData(n_clicks,jsonified_data, RawDir, AlphaDir):
 		window = Misc.WindowSize(WindowParameters["Rate"], WindowParameters["RateUnit"], WindowUnit, WindowN)
 	
 		FileExists = DatM.CheckExists(RawDir, AlphaDir, Data_i_Name)
-		if FileExists == True:
+		if FileExists == True and DatM.LoadState(AlphaDir, Data_i_Name) == None:
 			Alphasdf = DatM.LoadData(AlphaDir, Data_i_Name)
 		else:
-			#Error estimated on mean devition beween points
-			errs = Misc.errCalculation(data, WindowParameters["RateUnit"], True)	
-			Alphasdf = Fourier.AlphasProgress(data[Data_i_Name].values, window, errs, units, Data_i_Name)
-			Alphasdf.index = data.index
-			writer = pd.ExcelWriter("%s%s%s.xlsx" % (AlphaDir, os.sep, Data_i_Name), mode="w")
-			Alphasdf.to_excel(writer)
-			writer.save()
+			#Only rows appended since the last checkpoint are fitted
+			Alphasdf = UpdateAlphas(data, Data_i_Name, WindowParameters["RateUnit"], units, window, AlphaDir)
 
 		return Alphasdf.to_json(date_format='iso', orient='split'), ""
 
@@ -2293,24 +2511,9 @@ def update_graph(NClicks,ButtonState, RawDir, AlphaDir):
     '''
 	if NClicks not in [0, "0", None, "None"]:
 		Files = DatM.GlobDirectory(RawDir)
-		for Data_i_Name in Files:
-			print(Data_i_Name)
-			AlphaFileExists = DatM.CheckExists(RawDir, AlphaDir, Data_i_Name)
-			if AlphaFileExists == True:
-				continue
-			else:
-				data = DatM.LoadData(RawDir, Data_i_Name)
-				# Statistics of interest
-				WindowParameters = CalcStats.CalcStats(data[Data_i_Name])
-				units = Misc.CalcUnits(WindowParameters["Rate"],WindowParameters["RateUnit"])
-				window = Misc.WindowSize(WindowParameters["Rate"], WindowParameters["RateUnit"], WindowUnit, WindowN)
-				#Error estimated on mean devition beween points
-				errs = Misc.errCalculation(data, WindowParameters["RateUnit"], True)	
-				Alphasdf = Fourier.AlphasProgress(data[Data_i_Name].values, window, errs, units, Data_i_Name)
-				Alphasdf.index = data.index
-				writer = pd.ExcelWriter("%s%s%s.xlsx" % (AlphaDir, os.sep, Data_i_Name), mode="w")
-				Alphasdf.to_excel(writer)
-				writer.save()
+		#Features without results, one job each
+		Jobs = [[RawDir, AlphaDir, Data_i_Name] for Data_i_Name in Files if DatM.CheckExists(RawDir, AlphaDir, Data_i_Name) == False]
+		Workers.RunPool(Workers.AlphaWorker, Jobs)
 		return "Done", ""
 	else:
 		return ButtonState, ""
@@ -2446,24 +2649,11 @@ def LoadAlphasData(n_clicks, jsonified_data, BOCPDDirectory, RawDir):
 		units = Misc.CalcUnits(WindowParameters["Rate"],WindowParameters["RateUnit"])
 
 		FileExists = DatM.CheckExists(RawDir, BOCPDDirectory, Data_i_Name)
-		if FileExists == True:
+		if FileExists == True and DatM.LoadState(BOCPDDirectory, Data_i_Name) == None:
 			BOCPDdf = DatM.LoadData(BOCPDDirectory, Data_i_Name)
 		else:
-			#Error estimated on mean devition beween points
-			errs = Misc.errCalculation(data, WindowParameters["RateUnit"], False)
-			errs = np.sqrt(errs[1:]**2+errs[:-1]**2)			
-			BOCPDdf, R_Max, Ps =  BOCPD.bocd(data[Data_i_Name].diff(1).values[1:], BOCPD_errsScale*errs)
-			
-			
-			BOCPDdf = pd.DataFrame(BOCPDdf[:,:], index=data.index[1:])
-			writer = pd.ExcelWriter("%s%s%s.xlsx" % (BOCPDDirectory, os.sep, Data_i_Name), mode="w")
-			BOCPDdf.to_excel(writer)
-			writer.save()
-
-			Rmaxdf = pd.DataFrame(data={"R_Max":R_Max, "P":Ps}, index=data.index[1:])
-			writer = pd.ExcelWriter("%s%s%s_R_Max.xlsx" % (BOCPDDirectory, os.sep, Data_i_Name), mode="w")
-			Rmaxdf.to_excel(writer)
-			writer.save()
+			#Only rows appended since the last checkpoint are processed
+			BOCPDdf = UpdateBOCPD(data, Data_i_Name, WindowParameters["RateUnit"], BOCPDDirectory)
 
 		return BOCPDdf.to_json(date_format='iso', orient='split'), ""
 
@@ -2529,15 +2719,16 @@ def update_graph(jsonified_data, clickData):
 @app.callback(
 	[Output('BOCPDGraph', 'figure'),Output("BOCPDBOCPDDataSummary","children")],
 	[Input('BOCPDData','children')],
-	[State('BOCPDRawData','children')]
+	[State('BOCPDRawData','children'), State("BOCPDDirect", "children")]
 	)
-def update_graph(jsonified_dataBOCPD,jsonified_data):
+def update_graph(jsonified_dataBOCPD,jsonified_data, BOCPDDirectory):
 	'''
     Update BOCPD graph
 
             Parameters:
                     jsonified_dataAlphas (json): Jsonified Alpha data 
 					jsonified_data (json): Jsonified data
+					BOCPDDirectory (str): BOCPD Directory
 
             Returns:
 					Fig (dcc.Graph) : Figure element 
@@ -2555,20 +2746,29 @@ def update_graph(jsonified_dataBOCPD,jsonified_data):
 		WindowParameters["End"] = Misc.unixTimeMillis(data.index[-1])
 		BOCPDdf = pd.read_json(jsonified_dataBOCPD, orient='split')
 		BOCPDdf.index = BOCPDdf.index.tz_localize(None) 
+		#Format the stored file was written in, not the current setting
+		LogSpace = StoredLogSpace(BOCPDdf, Data_i_Name, BOCPDDirectory)
+		if LogSpace == True:
+			#-inf log probabilities are sent through json as null
+			BOCPDdf = BOCPDdf.fillna(-np.inf)
 		R_Max = np.argmax(BOCPDdf.values,axis=1)
 		Lines = BOCPDdf.index[np.argwhere(R_Max == 0).reshape(-1)]	
 		if len(Lines) > 20:	
 			Lines = []
-			Fig = DashPlots.CreateBOCPDFig(BOCPDdf, R_Max, Lines, WindowParameters, BOCPD_tol,  FigHeightPX/2)
+			Fig = DashPlots.CreateBOCPDFig(BOCPDdf, R_Max, Lines, WindowParameters, BOCPD_tol,  FigHeightPX/2, LogSpace)
 		else:
-			Fig = DashPlots.CreateBOCPDFig(BOCPDdf, R_Max, Lines, WindowParameters, BOCPD_tol,  FigHeightPX/2)
+			Fig = DashPlots.CreateBOCPDFig(BOCPDdf, R_Max, Lines, WindowParameters, BOCPD_tol,  FigHeightPX/2, LogSpace)
 
 		Stats = CalcStats.CalcBOCPDStats(R_Max, BOCPD_tol)
 
 		if SaveFigs == 1:
 			Name = Data_i_Name
 			NameDate =  "_%s_%s" % (BOCPDdf.index[0].strftime("%d%m%Y"),BOCPDdf.index[-1].strftime("%d%m%Y"))
-			p1 = Process(target=Graphing.plotMATPLOTLIBBOCPDHeat, args=[BOCPDdf.index, data[Data_i_Name].dropna().values[1:],data["Error"].dropna().values[1:], R_Max, BOCPDdf.values, BOCPD_tol,  Misc.timedeltaOneUnit(WindowParameters["Rate"],WindowParameters["RateUnit"]), [BOCPDdf.index[0],BOCPDdf.index[-1]], [0,int(max(R_Max)*1.2)], Lines, "Time, t", Data_i_Name, "cachefiles"+os.sep+"BOCPD", Name+NameDate, True])
+			if LogSpace == True:
+				R = 10**BOCPDdf.values
+			else:
+				R = BOCPDdf.values
+			p1 = Process(target=Graphing.plotMATPLOTLIBBOCPDHeat, args=[BOCPDdf.index, data[Data_i_Name].dropna().values[1:],data["Error"].dropna().values[1:], R_Max, R, BOCPD_tol,  Misc.timedeltaOneUnit(WindowParameters["Rate"],WindowParameters["RateUnit"]), [BOCPDdf.index[0],BOCPDdf.index[-1]], [0,int(max(R_Max)*1.2)], Lines, "Time, t", Data_i_Name, "cachefiles"+os.sep+"BOCPD", Name+NameDate, True])
 			p1.start()
 			p1.join()
 
@@ -2654,29 +2854,10 @@ def update_graph(NClicks, ButtonState, RawDir, BOCPDDirectory):
     '''
 	if NClicks not in [0, "0", None, "None"]:
 		Files = DatM.GlobDirectory(RawDir)
-		for Data_i_Name in Files:
-			FileExists = DatM.CheckExists(RawDir, BOCPDDirectory, Data_i_Name)
-			if FileExists == True:
-				continue
-			else:
-					#Run Anaylsis
-					data = DatM.LoadData(RawDir, Data_i_Name)
-					WindowParameters = CalcStats.CalcStats(data)
-					
-					#Error estimated on mean devition beween points
-					errs = Misc.errCalculation(data, WindowParameters["RateUnit"], False)
-					errs = np.sqrt(errs[1:]**2+errs[:-1]**2)		
-					BOCPDdf, R_Max, Ps =  BOCPD.bocd(data[Data_i_Name].diff(1).values[1:], BOCPD_errsScale*errs)
-
-					BOCPDdf = pd.DataFrame(BOCPDdf[:,:], index=data.index[1:])
-					writer = pd.ExcelWriter("%s%s%s.xlsx" % (BOCPDDirectory, os.sep, Data_i_Name), mode="w")
-					BOCPDdf.to_excel(writer)
-					writer.save()
-
-					Rmaxdf = pd.DataFrame(data={"R_Max":R_Max, "P":Ps}, index=data.index[1:])
-					writer = pd.ExcelWriter("%s%s%s_R_Max.xlsx" % (BOCPDDirectory, os.sep, Data_i_Name), mode="w")
-					Rmaxdf.to_excel(writer)
-					writer.save()
+		#Features without results, split across the workers
+		Files = [Data_i_Name for Data_i_Name in Files if DatM.CheckExists(RawDir, BOCPDDirectory, Data_i_Name) == False]
+		Jobs = [[RawDir, BOCPDDirectory, Names] for Names in Workers.Chunks(Files, Workers.Workers())]
+		Workers.RunPool(Workers.BOCPDWorker, Jobs)
 		return "Done", ""
 	else:
 		return ButtonState, ""
@@ -2811,7 +2992,7 @@ def update_graph(nclicks, Type, Vars, StringSearch):
 		if df.shape[0] < window:
 			return "Run", "", "", "", json.dumps(CalcStats.CalcStatsEmpty()), json.dumps(CalcStats.CalcPCAStatsEmpty()), ""
 			
-		DataPCA, Ts, Qs, Variances = PCA.PCA(df, PCA_NPCA, window) 
+		DataPCA, Ts, Qs, Variances = Workers.PCAParallel(df, PCA_NPCA, window) 
 		RegionsAll, _, _, _ =  PCA.PCARegionsCollect(Ts, Qs, dtMeasure, PCA_AlphaLim, PCA_NPCA, TestCol)
 		#Just care about time periods
 		PCAStats = CalcStats.CalcPCAStats(Ts, Qs, PCA_NPCA, Variances, RegionsAll)
@@ -2995,6 +3176,9 @@ def EmptyFolders():
 	files = glob.glob('data'+os.sep+'*'+os.sep+'*.xlsx')
 	files += glob.glob('cachefiles'+os.sep+'*'+os.sep+'*.png')
 	files += glob.glob('cachefiles'+os.sep+'*.json')
+	files += glob.glob('data'+os.sep+'*'+os.sep+'*_state.json')
+	files += glob.glob('data'+os.sep+'*'+os.sep+'*.npz')
+	files += glob.glob('data'+os.sep+'*'+os.sep+'*_append.csv')
 	for F in files:
 		print("Deleting %s" % F)
 		os.remove(F)
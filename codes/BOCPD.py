@@ -5,7 +5,12 @@ model with unknown mean parameter. For details, see Adams & MacKay 2007:
     https://arxiv.org/abs/0710.3742
 
 Contents:
+- Useful
+- Run length statistics
+- Run length posterior
+- Run length beam
 - BOCPD
+- Online BOCPD
 
 Author: Joseph Walker j.j.walker@durham.ac.uk
 ============================================================================"""
@@ -17,67 +22,366 @@ BOCPD_tol = 1e-2
 BOCPD_MaxSeqLength = 100
 #hazard: The estimated CP rate. 
 BOCPD_hazard = 1/100
+#LogSpace: 0/1 run the recursion on log probabilities and return a log10 posterior
+BOCPD_LogSpace = 0
 
 ################################################################################################################
 # Functions:
 ################################################################################################################
 
+######################
+# Useful:
+######################
+
+def LogSumExp(x):
+	"""Numerically stable log(sum(exp(x))).
+	x: np.array of log values
+	Return,
+	L: The log of the summed exponentials
+	"""
+	m = np.max(x)
+	if not np.isfinite(m):
+		return m
+	return m + np.log(np.sum(np.exp(x - m)))
+
+######################
+# Run length statistics:
+######################
+
+class RunLengthStats:
+	"""Running sufficient statistics for every candidate run length ending at the newest point.
+	Prefix sums / counts of the data give the window means and a monotone stack of the errors
+	gives the window maxima, so all run lengths for a step come from one vectorised expression.
+	"""
+	def __init__(self):
+		#Prefix sums and counts of the non-nan data, Sums[k] - Sums[j] is the sum over points j..k-1
+		self.Sums = np.zeros(1)
+		self.Counts = np.zeros(1)
+		#Absolute index of Sums[0]
+		self.Start = 0
+		#Number of points pushed
+		self.N = 0
+		#Monotone decreasing stack of (index, error). Entry k is the max of errs[StackIdx[k-1]+1:t+1]
+		self.StackIdx = np.zeros(0, dtype=np.int64)
+		self.StackErr = np.zeros(0)
+
+	def push(self, x, e):
+		"""Add a new datapoint.
+		x: The data value
+		e: The associated error
+		"""
+		Valid = not np.isnan(x)
+		self.Sums = np.append(self.Sums, self.Sums[-1] + (x if Valid else 0.0))
+		self.Counts = np.append(self.Counts, self.Counts[-1] + Valid)
+		if not np.isnan(e):
+			#Pop every error no larger than the new one
+			Top = np.searchsorted(-self.StackErr, -e, side="left")
+			self.StackIdx = np.append(self.StackIdx[:Top], self.N)
+			self.StackErr = np.append(self.StackErr[:Top], e)
+		self.N += 1
+
+	def params(self, M):
+		"""Window mean and max error for run lengths 0..M-1 at the newest point t, i.e. over data[t-i-1:t+1].
+		M: Number of run lengths
+		Return,
+		means: np.nanmean of each window
+		maxerrs: np.nanmax of the errors in each window
+		"""
+		t = self.N - 1
+		Starts = t - 1 - np.arange(M)
+		Local = Starts - self.Start
+		with np.errstate(invalid="ignore", divide="ignore"):
+			means = (self.Sums[-1] - self.Sums[Local]) / (self.Counts[-1] - self.Counts[Local])
+		Pos = np.searchsorted(self.StackIdx, Starts, side="left")
+		maxerrs = np.append(self.StackErr, np.nan)[Pos]
+		return means, maxerrs
+
+	def trim(self, M):
+		"""Drop history no longer reachable by the next step.
+		M: Length of the current message
+		"""
+		Oldest = self.N - 1 - M
+		Drop = Oldest - self.Start
+		if Drop > 0:
+			#Rebase the sums to keep their magnitude (and rounding) small
+			self.Sums = self.Sums[Drop:] - self.Sums[Drop]
+			self.Counts = self.Counts[Drop:] - self.Counts[Drop]
+			self.Start = Oldest
+		Keep = np.searchsorted(self.StackIdx, Oldest, side="left")
+		if Keep > 0:
+			self.StackIdx = self.StackIdx[Keep:]
+			self.StackErr = self.StackErr[Keep:]
+
+######################
+# Run length posterior:
+######################
+
+class RunLengthPosterior:
+	"""Ragged (CSR-style) storage of the run length posterior. Row t holds the surviving
+	run lengths 0..len-1 of the truncated message, so memory scales with the sum of the
+	message lengths rather than T^2. With Sparse the run length of every stored value is
+	kept as well, for messages that are not a contiguous range of run lengths.
+	"""
+	def __init__(self, Fill=0.0, Sparse=False):
+		#Value of run lengths not stored in a row
+		self.Fill = Fill
+		self.Sparse = Sparse
+		self.Values = np.zeros(16)
+		self.Indices = np.zeros(16 if Sparse else 0, dtype=np.int64)
+		self.Offsets = np.zeros(16, dtype=np.int64)
+		self.NRows = 0
+
+	def __len__(self):
+		return self.NRows
+
+	def append(self, row, RunLengths=None):
+		"""Append the run length distribution of the next timestep.
+		row: np.array of the probabilities of run lengths 0..len(row)-1
+		RunLengths: np.array of the run length of each entry in row, required if Sparse
+		"""
+		Start = self.Offsets[self.NRows]
+		Stop = Start + len(row)
+		if Stop > len(self.Values):
+			self.Values = np.resize(self.Values, max(Stop, 2*len(self.Values)))
+			if self.Sparse == True:
+				self.Indices = np.resize(self.Indices, len(self.Values))
+		if self.NRows + 2 > len(self.Offsets):
+			self.Offsets = np.resize(self.Offsets, 2*len(self.Offsets))
+		self.Values[Start:Stop] = row
+		if self.Sparse == True:
+			self.Indices[Start:Stop] = RunLengths
+		self.NRows += 1
+		self.Offsets[self.NRows] = Stop
+
+	def extend(self, Values, Lengths):
+		"""Append the run length distributions of several timesteps at once.
+		Values: np.array of the rows one after another
+		Lengths: np.array of the number of run lengths in each row
+		"""
+		Start = self.Offsets[self.NRows]
+		Stop = Start + len(Values)
+		if Stop > len(self.Values):
+			self.Values = np.resize(self.Values, max(Stop, 2*len(self.Values)))
+		if self.NRows + len(Lengths) + 1 > len(self.Offsets):
+			self.Offsets = np.resize(self.Offsets, max(self.NRows + len(Lengths) + 1, 2*len(self.Offsets)))
+		self.Values[Start:Stop] = Values
+		self.Offsets[self.NRows+1:self.NRows+len(Lengths)+1] = Start + np.cumsum(Lengths)
+		self.NRows += len(Lengths)
+
+	def row(self, t):
+		"""Stored run length distribution at timestep t."""
+		return self.Values[self.Offsets[t]:self.Offsets[t+1]]
+
+	def runlengths(self, t):
+		"""Run lengths of the stored values at timestep t."""
+		if self.Sparse == True:
+			return self.Indices[self.Offsets[t]:self.Offsets[t+1]]
+		return np.arange(self.Offsets[t+1]-self.Offsets[t])
+
+	def lengths(self):
+		"""Number of stored run lengths per row."""
+		return np.diff(self.Offsets[:self.NRows+1])
+
+	def max(self):
+		"""Most probable value per row."""
+		if self.NRows == 0:
+			return np.zeros(0)
+		return np.maximum.reduceat(self.Values[:self.Offsets[self.NRows]], self.Offsets[:self.NRows])
+
+	def argmax(self):
+		"""Most probable run length per row."""
+		Maxs = self.max()
+		Lengths = self.lengths()
+		Rows = np.repeat(np.arange(self.NRows), Lengths)
+		Hits = np.flatnonzero(self.Values[:self.Offsets[self.NRows]] == np.repeat(Maxs, Lengths))
+		HitRows, First = np.unique(Rows[Hits], return_index=True)
+		Pos = np.zeros(self.NRows, dtype=np.int64)
+		Pos[HitRows] = Hits[First]
+		#Rows containing nans, fall back to numpy's convention
+		for t in np.setdiff1d(np.arange(self.NRows), HitRows):
+			Pos[t] = self.Offsets[t] + np.argmax(self.row(t))
+		if self.Sparse == True:
+			return self.Indices[Pos]
+		return Pos - self.Offsets[:self.NRows]
+
+	def maxrunlength(self):
+		"""Longest stored run length + 1."""
+		if self.Sparse == True:
+			return int(np.max(self.Indices[:self.Offsets[self.NRows]], initial=-1)) + 1
+		return int(np.max(self.lengths(), initial=0))
+
+	def dense(self, t0=0, t1=None, r0=0, r1=None):
+		"""Materialise a dense slab of the posterior.
+		t0, t1: Timestep range [t0, t1)
+		r0, r1: Run length range [r0, r1)
+		Return,
+		R: np.array of shape (t1-t0, r1-r0)
+		"""
+		if t1 == None:
+			t1 = self.NRows
+		if r1 == None:
+			r1 = max(self.maxrunlength(), r0)
+		R = np.full((t1-t0, r1-r0), self.Fill, dtype=self.Values.dtype)
+		for t in range(t0, t1):
+			if self.Sparse == True:
+				Idx = self.runlengths(t)
+				Keep = (Idx >= r0) & (Idx < r1)
+				R[t-t0, Idx[Keep]-r0] = self.row(t)[Keep]
+			else:
+				Row = self.row(t)[r0:r1]
+				R[t-t0, :len(Row)] = Row
+		return R
+
+######################
+# Run length beam:
+######################
+
+class RunLengthBeam:
+	"""Fixed budget approximation of the run length distribution keeping at most K hypotheses.
+	Each hypothesis carries its own window sum, count and max error so that time and memory
+	per step are O(K) whatever the run lengths kept.
+	"""
+	def __init__(self, K, Log=False):
+		self.K = K
+		self.Log = Log
+		self.RunLengths = np.zeros(0, dtype=np.int64)
+		self.message = np.zeros(0)
+		#Statistics of the points t-r..t for each hypothesis of run length r
+		self.Sums = np.zeros(0)
+		self.Counts = np.zeros(0)
+		self.Maxs = np.zeros(0)
+
+	def start(self, x, e):
+		"""Initialise the beam on the first datapoint.
+		x: The first datapoint
+		e: The associated error
+		"""
+		Valid = not np.isnan(x)
+		self.RunLengths = np.zeros(1, dtype=np.int64)
+		self.message = np.zeros(1) if self.Log == True else np.ones(1)
+		self.Sums = np.array([x if Valid else 0.0])
+		self.Counts = np.array([float(Valid)])
+		self.Maxs = np.array([e])
+
+	def step(self, x, e):
+		"""Advance the beam by one datapoint, pruning to the K most probable run lengths.
+		x: The new datapoint
+		e: The associated error
+		Return,
+		Discarded: The probability mass dropped by the pruning
+		"""
+		pdf = lambda x, mu, sig: np.exp(-0.5*((x-mu)/sig)**2.0)/(sig*np.sqrt(2*np.pi))
+		pdflog = lambda x, mu, sig: -0.5*((x-mu)/sig)**2.0 - np.log(sig*np.sqrt(2*np.pi))
+
+		# 2. Evaluate predictive probabilities.
+		Valid = not np.isnan(x)
+		Sums = self.Sums + (x if Valid else 0.0)
+		Counts = self.Counts + Valid
+		Maxs = np.fmax(self.Maxs, e)
+		with np.errstate(invalid="ignore", divide="ignore"):
+			mean_params = Sums / Counts
+		sig_params = Maxs + BOCPD_tol
+
+		if self.Log == True:
+			pis = pdflog(x, mean_params, sig_params)
+			growth_probs = pis + self.message + np.log(1 - BOCPD_hazard)
+			cp_prob = LogSumExp(self.message) + np.log(BOCPD_hazard)
+			new_joint = np.append(cp_prob, growth_probs)
+			new_joint -= LogSumExp(new_joint)
+		else:
+			pis = pdf(x, mean_params, sig_params)
+			growth_probs = pis * self.message * (1 - BOCPD_hazard)
+			cp_prob = np.sum(self.message*BOCPD_hazard)
+			new_joint = np.append(cp_prob, growth_probs)
+			new_joint /= np.sum(new_joint)
+
+		RunLengths = np.append(0, self.RunLengths + 1)
+		Sums = np.append(x if Valid else 0.0, Sums)
+		Counts = np.append(float(Valid), Counts)
+		Maxs = np.append(e, Maxs)
+
+		# Keep the K most probable run lengths, in run length order
+		Discarded = 0.0
+		if len(new_joint) > self.K:
+			Keep = np.sort(np.argpartition(-new_joint, self.K-1)[:self.K])
+			Drop = np.ones(len(new_joint), dtype=bool)
+			Drop[Keep] = False
+			if self.Log == True:
+				Discarded = np.exp(LogSumExp(new_joint[Drop]))
+				new_joint = new_joint[Keep] - LogSumExp(new_joint[Keep])
+			else:
+				Discarded = np.sum(new_joint[Drop])
+				new_joint = new_joint[Keep] / np.sum(new_joint[Keep])
+			RunLengths, Sums, Counts, Maxs = RunLengths[Keep], Sums[Keep], Counts[Keep], Maxs[Keep]
+
+		self.message = new_joint
+		self.RunLengths = RunLengths
+		self.Sums, self.Counts, self.Maxs = Sums, Counts, Maxs
+		return Discarded
+
 ######################
 # BOCPD:
 ######################
 
-def bocd(data, errs):
-	"""The BOCPD algorithum, Return run length posterior using Algorithm 1 in Adams & MacKay 2007.
-	data: Timeseries data
-	errs: The assoicated errs on the data (or scaled)
+def DenseTruncated(R):
+	"""Dense matrix of a run of bocd as returned with Dense, truncated to BOCPD_MaxSeqLength.
+	R: RunLengthPosterior of the whole run
 	Return,
 	R: The BOCP probability matrix
 	"""
-	#scaler = StandardScaler()
-	#scaler.fit(data.reshape(-1, 1))
-	#data = scaler.transform(data.reshape(-1, 1))[:,0]
-	#errs = scaler.transform(errs.reshape(-1, 1))[:,0]
-
-	# 1. Initialize lower triangular matrix representing the posterior as
-	# function of time. Model parameters are initialized in the model class.
-	T = data.shape[0]
-	R = np.zeros((T, T + 1), dtype=np.float64)
-	R[:, 0] = 1.0
-	message = R[0,:0+1]
+	if len(R) > 1:
+		return R.dense(r1=int(min(max(R.maxrunlength()-1, 1), BOCPD_MaxSeqLength)))
+	return R.dense(r1=len(R)+1)
 
+def BOCPDStep(message, Stats, x, e, Log=False):
+	"""Advance the run length distribution by one datapoint.
+	message: The run length distribution at the previous timestep
+	Stats: RunLengthStats of the points seen so far
+	x: The new datapoint
+	e: The associated error
+	Log: T/F message holds natural log probabilities
+	Return,
+	message: The truncated run length distribution including x
+	"""
 	pdf = lambda x, mu, sig: np.exp(-0.5*((x-mu)/sig)**2.0)/(sig*np.sqrt(2*np.pi))
 	pdflog = lambda x, mu, sig: -0.5*((x-mu)/sig)**2.0 - np.log(sig*np.sqrt(2*np.pi))
 
-	MaxMessage = 1
-	for t in range(1, T):
-		# 2. Evaluate predictive probabilities.
+	# 2. Evaluate predictive probabilities.
+	Stats.push(x, e)
 
-		M = len(message)
-		pis = np.zeros(M)
-		#pislog = np.zeros(M)
-		mean_params = np.zeros(M)
-		sig_params = np.zeros(M)
-		for i in range(0,M):
-			dat_i = data[t-i-1:t+1]
-			errs_i = errs[t-i-1:t+1]
-
-			mean_params[i] = np.nanmean(dat_i)
-			sig_params[i] = np.nanmax(errs_i)+BOCPD_tol
-			pis[i] = pdf(data[t], mean_params[i], sig_params[i])
-			#print(pis[i],mean_params[i], sig_params[i])
-			#pislog[i] = pdflog(data[t], mean_params[i], sig_params[i])
+	M = len(message)
+	mean_params, sig_params = Stats.params(M)
+	sig_params = sig_params + BOCPD_tol
+
+	if Log == True:
+		pis = pdflog(x, mean_params, sig_params)
+
+		# 4. Calculate growth probabilities.
+		growth_probs = pis + message + np.log(1 - BOCPD_hazard)
+
+		# 5. Calculate changepoint probabilities.
+		cp_prob = LogSumExp(message) + np.log(BOCPD_hazard)
+
+		# 6. Calculate evidence
+		new_joint = np.append(cp_prob, growth_probs)
+
+		# 7. Determine run length distribution.
+		new_joint -= LogSumExp(new_joint)
+
+		# Setup message passing.
+		Array = np.logaddexp.accumulate(new_joint[::-1])[::-1] < np.log(BOCPD_tol)
+	else:
+		pis = pdf(x, mean_params, sig_params)
 
 		# 4. Calculate growth probabilities.
 		growth_probs = pis * message * (1 - BOCPD_hazard)
 
- 
 		# 5. Calculate changepoint probabilities.
 		cp_prob = sum(message*BOCPD_hazard)
 
-     
 		# 6. Calculate evidence
 		new_joint = np.append(cp_prob, growth_probs)
-       
+
 		# 7. Determine run length distribution.
 		new_joint /= sum(new_joint)
 
@@ -85,29 +389,331 @@ def bocd(data, errs):
 		psum = np.cumsum(new_joint[::-1])
 		Array = psum[::-1]<BOCPD_tol
 
-		if Array.any() == True:
-			seqlen = -1
-			for i in range(len(new_joint)):
-				if Array[i] == True:
-					seqlen = i
-					break
-			new_joint = new_joint[:seqlen]
+	if Array.any() == True:
+		seqlen = np.argmax(Array)
+		new_joint = new_joint[:seqlen]
 
-		R[t, :len(new_joint)] = new_joint
-		message = new_joint
+	Stats.trim(len(new_joint))
+	return new_joint
+
+def bocd(data, errs, Dense=True, Log=None):
+	"""The BOCPD algorithum, Return run length posterior using Algorithm 1 in Adams & MacKay 2007.
+	data: Timeseries data
+	errs: The assoicated errs on the data (or scaled)
+	Dense: T/F return R as a dense matrix truncated to BOCPD_MaxSeqLength, else the RunLengthPosterior
+	Log: T/F run in log space and return R as log10 probabilities, defaults to BOCPD_LogSpace
+	Return,
+	R: The BOCP probability matrix
+	R_Max: The most likely sequence length at each timestep
+	Ps: The probability of R_Max
+	"""
+	#scaler = StandardScaler()
+	#scaler.fit(data.reshape(-1, 1))
+	#data = scaler.transform(data.reshape(-1, 1))[:,0]
+	#errs = scaler.transform(errs.reshape(-1, 1))[:,0]
+	if Log == None:
+		Log = BOCPD_LogSpace == 1
+
+	# 1. Initialize ragged storage representing the posterior as
+	# function of time. Model parameters are initialized in the model class.
+	T = data.shape[0]
+	if Log == True:
+		R = RunLengthPosterior(Fill=-np.inf)
+		message = np.zeros(1)
+	else:
+		R = RunLengthPosterior()
+		message = np.ones(1)
+	R.append(message)
+
+	Stats = RunLengthStats()
+	Stats.push(data[0], errs[0])
+
+	MaxMessage = 1
+	for t in range(1, T):
+		message = BOCPDStep(message, Stats, data[t], errs[t], Log)
+		if Log == True:
+			R.append(message/np.log(10))
+		else:
+			R.append(message)
 
 		if len(message)-1 > MaxMessage:
 			MaxMessage = len(message)-1
 
 
-	R_Max = np.argmax(R,axis=1)
-	Ps = [ R[i,R_Max[i]] for i in range(R.shape[0])]
-	if R.shape[0] > 1:
+	R_Max = R.argmax()
+	if Log == True:
+		Ps = list(10**R.max())
+	else:
+		Ps = list(R.max())
+	if Dense == False:
+		return R, R_Max, Ps
+	if T > 1:
 		if MaxMessage > BOCPD_MaxSeqLength:
 			MaxMessage = BOCPD_MaxSeqLength
-		if MaxMessage < R.shape[1]:
-			R = R[:,:int(MaxMessage)] #Truncate
-	return R, R_Max, Ps
+		return R.dense(r1=int(MaxMessage)), R_Max, Ps #Truncate
+	return R.dense(r1=T+1), R_Max, Ps
+
+def bocdBeam(data, errs, K, Dense=True, Log=None):
+	"""Approximate BOCPD keeping at most K run length hypotheses per timestep.
+	data: Timeseries data
+	errs: The assoicated errs on the data (or scaled)
+	K: The maximum number of run lengths kept
+	Dense: T/F return R as a dense matrix truncated to BOCPD_MaxSeqLength, else the RunLengthPosterior
+	Log: T/F run in log space and return R as log10 probabilities, defaults to BOCPD_LogSpace
+	Return,
+	R: The BOCP probability matrix
+	R_Max: The most likely sequence length at each timestep
+	Ps: The probability of R_Max
+	Discarded: The probability mass discarded at each timestep
+	"""
+	if Log == None:
+		Log = BOCPD_LogSpace == 1
+
+	T = data.shape[0]
+	R = RunLengthPosterior(Fill=-np.inf if Log == True else 0.0, Sparse=True)
+	Discarded = np.zeros(T)
+
+	Beam = RunLengthBeam(K, Log)
+	Beam.start(data[0], errs[0])
+	R.append(Beam.message, Beam.RunLengths)
+	for t in range(1, T):
+		Discarded[t] = Beam.step(data[t], errs[t])
+		if Log == True:
+			R.append(Beam.message/np.log(10), Beam.RunLengths)
+		else:
+			R.append(Beam.message, Beam.RunLengths)
+
+	R_Max = R.argmax()
+	if Log == True:
+		Ps = list(10**R.max())
+	else:
+		Ps = list(R.max())
+	if Dense == False:
+		return R, R_Max, Ps, Discarded
+	return DenseTruncated(R), R_Max, Ps, Discarded
+
+def bocdBatch(data, errs, Dense=True, Log=None):
+	"""BOCPD over several features at once, advancing every run length distribution in lock-step.
+	Messages are padded to the longest one and masked beyond each feature's own length.
+	data: np.array (n_features, T) of timeseries data
+	errs: np.array (n_features, T) of the assoicated errs on the data (or scaled)
+	Dense: T/F return each R as a dense matrix truncated to BOCPD_MaxSeqLength, else the RunLengthPosterior
+	Log: T/F run in log space and return R as log10 probabilities, defaults to BOCPD_LogSpace
+	Return,
+	Rs: List of the BOCP probability matrix of each feature
+	R_Maxs: List of the most likely sequence length at each timestep of each feature
+	Pss: List of the probability of R_Max of each feature
+	"""
+	if Log == None:
+		Log = BOCPD_LogSpace == 1
+	pdf = lambda x, mu, sig: np.exp(-0.5*((x-mu)/sig)**2.0)/(sig*np.sqrt(2*np.pi))
+	pdflog = lambda x, mu, sig: -0.5*((x-mu)/sig)**2.0 - np.log(sig*np.sqrt(2*np.pi))
+
+	data = np.atleast_2d(data)
+	errs = np.atleast_2d(errs)
+	N, T = data.shape
+	Fill = -np.inf if Log == True else 0.0
+	Features = range(N)
+
+	#Prefix sums and counts of the non-nan data
+	Sums = np.zeros((N, T+1))
+	Counts = np.zeros((N, T+1))
+	Sums[:,1:] = np.nancumsum(data, axis=1)
+	Counts[:,1:] = np.cumsum(~np.isnan(data), axis=1)
+
+	# 1. Initialize padded messages and their lengths
+	message = np.zeros((N, 1)) if Log == True else np.ones((N, 1))
+	Lengths = np.ones(N, dtype=np.int64)
+	#Every feature's row of a timestep is stored together, split per feature at the end
+	Steps = RunLengthPosterior(Fill=Fill)
+	Steps.append(message[:,0])
+	StepLengths = np.ones((T, N), dtype=np.int64)
+
+	MaxMessage = np.ones(N, dtype=np.int64)
+	for t in range(1, T):
+		# 2. Evaluate predictive probabilities.
+		M = message.shape[1]
+		Starts = t - 1 - np.arange(M)
+		with np.errstate(invalid="ignore", divide="ignore"):
+			mean_params = (Sums[:,[t+1]] - Sums[:,Starts]) / (Counts[:,[t+1]] - Counts[:,Starts])
+		sig_params = np.fmax.accumulate(errs[:,t-M:t+1][:,::-1], axis=1)[:,1:] + BOCPD_tol
+		Valid = np.arange(M) < Lengths[:,None]
+
+		if Log == True:
+			pis = pdflog(data[:,[t]], mean_params, sig_params)
+
+			# 4. Calculate growth probabilities.
+			growth_probs = np.where(Valid, pis + message + np.log(1 - BOCPD_hazard), -np.inf)
+
+			# 5. Calculate changepoint probabilities.
+			cp_prob = np.logaddexp.reduce(message, axis=1) + np.log(BOCPD_hazard)
+
+			# 6. Calculate evidence
+			new_joint = np.hstack([cp_prob[:,None], growth_probs])
+
+			# 7. Determine run length distribution.
+			new_joint -= np.logaddexp.reduce(new_joint, axis=1)[:,None]
+
+			# Setup message passing.
+			Array = np.logaddexp.accumulate(new_joint[:,::-1], axis=1)[:,::-1] < np.log(BOCPD_tol)
+		else:
+			pis = pdf(data[:,[t]], mean_params, sig_params)
+
+			# 4. Calculate growth probabilities.
+			growth_probs = np.where(Valid, pis * message * (1 - BOCPD_hazard), 0.0)
+
+			# 5. Calculate changepoint probabilities.
+			cp_prob = np.sum(message*BOCPD_hazard, axis=1)
+
+			# 6. Calculate evidence
+			new_joint = np.hstack([cp_prob[:,None], growth_probs])
+
+			# 7. Determine run length distribution.
+			new_joint /= np.sum(new_joint, axis=1)[:,None]
+
+			# Setup message passing.
+			Array = np.cumsum(new_joint[:,::-1], axis=1)[:,::-1] < BOCPD_tol
+
+		#Padding always falls in the truncated tail
+		Lengths = np.where(Array.any(axis=1), np.argmax(Array, axis=1), M+1)
+		message = new_joint[:,:np.max(Lengths)]
+		Valid = np.arange(message.shape[1]) < Lengths[:,None]
+		message[~Valid] = Fill
+		MaxMessage = np.maximum(MaxMessage, Lengths-1)
+		Steps.append(message[Valid])
+		StepLengths[t] = Lengths
+
+	Values = Steps.Values[:Steps.Offsets[T]]
+	if Log == True:
+		Values = Values/np.log(10)
+	#Position of each feature's row within its timestep
+	Within = np.cumsum(StepLengths, axis=1) - StepLengths
+	Rs = [RunLengthPosterior(Fill=Fill) for n in Features]
+	for n in Features:
+		Starts = Steps.Offsets[:T] + Within[:,n]
+		Idx = np.repeat(Starts - (np.cumsum(StepLengths[:,n]) - StepLengths[:,n]), StepLengths[:,n]) + np.arange(np.sum(StepLengths[:,n]))
+		Rs[n].extend(Values[Idx], StepLengths[:,n])
+
+	R_Maxs = [R.argmax() for R in Rs]
+	if Log == True:
+		Pss = [list(10**R.max()) for R in Rs]
+	else:
+		Pss = [list(R.max()) for R in Rs]
+	if Dense == True:
+		if T > 1:
+			Rs = [Rs[n].dense(r1=int(min(MaxMessage[n], BOCPD_MaxSeqLength))) for n in Features]
+		else:
+			Rs = [R.dense(r1=T+1) for R in Rs]
+	return Rs, R_Maxs, Pss
+
+######################
+# Online BOCPD:
+######################
+
+class OnlineBOCPD:
+	"""Stateful BOCPD detector for data arriving over time. Only appended points are processed,
+	each at a cost set by the truncated message length and not by the length of the history.
+	The state can be checkpointed to a JSON compatible dictionary and restored.
+	"""
+	def __init__(self, Log=None):
+		if Log == None:
+			Log = BOCPD_LogSpace == 1
+		self.Log = Log
+		self.Stats = RunLengthStats()
+		if Log == True:
+			self.message = np.zeros(1)
+		else:
+			self.message = np.ones(1)
+		#Timestamp of the last processed point
+		self.LastTime = None
+
+	def update(self, data, errs, times=None):
+		"""Process newly appended points, identical to continuing bocd over them.
+		data: New timeseries data
+		errs: The assoicated errs on the data (or scaled)
+		times: Timestamps of the new points
+		Return,
+		R: RunLengthPosterior rows for the new points, log10 probabilities if Log
+		"""
+		if self.Log == True:
+			R = RunLengthPosterior(Fill=-np.inf)
+		else:
+			R = RunLengthPosterior()
+		for i in range(len(data)):
+			if self.Stats.N == 0:
+				self.Stats.push(data[i], errs[i])
+			else:
+				self.message = BOCPDStep(self.message, self.Stats, data[i], errs[i], self.Log)
+			if self.Log == True:
+				R.append(self.message/np.log(10))
+			else:
+				R.append(self.message)
+		if times is not None and len(times) > 0:
+			self.LastTime = times[-1]
+		return R
+
+	def state(self):
+		"""Checkpoint of the detector.
+		Return,
+		State: JSON compatible dictionary
+		"""
+		return {
+			"Log" : bool(self.Log),
+			"message" : self.message.tolist(),
+			"LastTime" : self.LastTime,
+			"Sums" : self.Stats.Sums.tolist(),
+			"Counts" : self.Stats.Counts.tolist(),
+			"Start" : int(self.Stats.Start),
+			"N" : int(self.Stats.N),
+			"StackIdx" : self.Stats.StackIdx.tolist(),
+			"StackErr" : self.Stats.StackErr.tolist(),
+		}
+
+	@classmethod
+	def from_posterior(cls, R, data, errs):
+		"""Detector continuing a completed run of bocd, bocdBatch or bocdBeam from its final row.
+		Run lengths a beam did not keep restart with zero probability.
+		R: RunLengthPosterior of the run, log10 probabilities if its Fill is -inf
+		data: The data of the run
+		errs: The errors of the run
+		Return,
+		Detector: OnlineBOCPD
+		"""
+		Detector = cls(R.Fill == -np.inf)
+		t = len(R) - 1
+		RunLengths = R.runlengths(t)
+		Detector.message = np.full(int(np.max(RunLengths)) + 1, R.Fill)
+		if Detector.Log == True:
+			Detector.message[RunLengths] = R.row(t)*np.log(10)
+		else:
+			Detector.message[RunLengths] = R.row(t)
+		#Only the points reachable by the next step are needed
+		First = max(len(data) - len(Detector.message) - 1, 0)
+		for i in range(First, len(data)):
+			Detector.Stats.push(data[i], errs[i])
+		Detector.Stats.Start += First
+		Detector.Stats.N += First
+		Detector.Stats.StackIdx += First
+		Detector.Stats.trim(len(Detector.message))
+		return Detector
+
+	@classmethod
+	def from_state(cls, State):
+		"""Restore a detector from a checkpoint.
+		State: Dictionary returned by state()
+		Return,
+		Detector: OnlineBOCPD
+		"""
+		Detector = cls(State.get("Log", False))
+		Detector.message = np.array(State["message"], dtype=np.float64)
+		Detector.LastTime = State["LastTime"]
+		Detector.Stats.Sums = np.array(State["Sums"], dtype=np.float64)
+		Detector.Stats.Counts = np.array(State["Counts"], dtype=np.float64)
+		Detector.Stats.Start = State["Start"]
+		Detector.Stats.N = State["N"]
+		Detector.Stats.StackIdx = np.array(State["StackIdx"], dtype=np.int64)
+		Detector.Stats.StackErr = np.array(State["StackErr"], dtype=np.float64)
+		return Detector
 
 if __name__ == "__main__":
 	print("Run as module") 
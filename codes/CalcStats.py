@@ -219,11 +219,12 @@ def CalcPCAStats(Ts, Qs, NPCA, Vs, Regions):
 	Params: A dictionary of key statistics {"NRegions", "TsMean", "QsMean", "TsMax", "QsMax", "NPCA", "VarianceFracs"}
 	'''
 	NRegions = Regions.shape[0]
-	TsMean = np.nanmean(Ts["Ts"].values)
-	QsMean = np.nanmean(Qs["Qs"].values)
-	TsMax = np.nanmax(Ts["Ts"].values)
-	QsMax = np.nanmax(Qs["Qs"].values)
-	VFracs = np.nanmean(Vs.values, axis=0)
+	#Double precision so single precision results still serialise
+	TsMean = float(np.nanmean(Ts["Ts"].values, dtype=np.float64))
+	QsMean = float(np.nanmean(Qs["Qs"].values, dtype=np.float64))
+	TsMax = float(np.nanmax(Ts["Ts"].values))
+	QsMax = float(np.nanmax(Qs["Qs"].values))
+	VFracs = np.nanmean(Vs.values, axis=0, dtype=np.float64)
 	return { "NRegions" : NRegions,
 		"TsMean" : Misc.round_sig(TsMean,2),
 		"QsMean" : Misc.round_sig(QsMean,2),
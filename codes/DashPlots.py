@@ -454,7 +454,7 @@ def CreateAlphasFig(Alphasdf, WindowParameters, sig, Height, Name):
 # Figures Code: BOCPD Fig
 ######################
 
-def CreateBOCPDFig(BOCPDdf, R_Max, Lines, WindowParameters, tol, Height):
+def CreateBOCPDFig(BOCPDdf, R_Max, Lines, WindowParameters, tol, Height, Log=False):
 	''' Example Alpha plots.
 	BOCPDdf:df "Alpha" and "Errs" values at each timestep
 	R_Max: The Most likely sequence length at time t
@@ -463,10 +463,14 @@ def CreateBOCPDFig(BOCPDdf, R_Max, Lines, WindowParameters, tol, Height):
 	Sig: Error multiplier,
 	tol: The P value truncation size
 	Height: Height in pixels required. (Width autoscales)
+	Log: T/F BOCPDdf already holds log10 probabilities
 	Return,
 	Fig: A figure html element.'''
 	Zmin = np.log10(tol)
-	Zs = np.nan_to_num(np.log10(BOCPDdf.values.T), nan=-np.inf,posinf=np.inf, neginf=-np.inf)
+	if Log == True:
+		Zs = BOCPDdf.values.T
+	else:
+		Zs = np.nan_to_num(np.log10(BOCPDdf.values.T), nan=-np.inf,posinf=np.inf, neginf=-np.inf)
 
 	YRange = [0,np.max(R_Max)+20]
 	XRange = [Misc.unixToDatetime(WindowParameters["Start"]),Misc.unixToDatetime(WindowParameters["End"])]
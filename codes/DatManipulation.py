@@ -94,6 +94,9 @@ def LoadData(DataDirectory, ColName, inter=True):
 	DATA = pd.read_excel(FileName,
 		header=0,na_values=na_values,
 		convert_float=False, index_col=0)
+	Appended = LoadAppended(DataDirectory, ColName)
+	if Appended is not None:
+		DATA = pd.concat([DATA, Appended])
 
 	if inter == True:
 		#Interpolate nan values
@@ -105,6 +108,51 @@ def LoadData(DataDirectory, ColName, inter=True):
 			DATA[ColName] = DATA[ColName].interpolate(method ='linear', limit_direction ='both',limit=100) 
 	return DATA
 
+def AppendData(DataDirectory, ColName, df):
+	'''Append rows to the csv kept next to a workbook so the workbook is not rewritten,
+	DataDirectory: Folder of processed data
+	ColName: The name of the workbook
+	df: Dataframe of the new rows
+	Return,
+	1: If completes without error.'''
+	AppendFile = DataDirectory+os.sep+ColName+"_append.csv"
+	df = df.copy()
+	df.columns = ["%s" % C for C in df.columns]
+	if os.path.isfile(AppendFile):
+		Columns = list(pd.read_csv(AppendFile, index_col=0, nrows=0).columns)
+		if set(df.columns).issubset(Columns):
+			df.reindex(columns=Columns).to_csv(AppendFile, mode="a", header=False)
+			return 1
+		#New columns, rewrite the (small) append file with the wider header
+		df = pd.concat([pd.read_csv(AppendFile, index_col=0, parse_dates=True), df])
+	df.to_csv(AppendFile)
+	return 1
+
+def LoadAppended(DataDirectory, ColName):
+	'''Load the rows appended to a workbook,
+	DataDirectory: Folder of processed data
+	ColName: The name of the workbook
+	Return,
+	DATA: Loaded dataframe or None if nothing was appended'''
+	AppendFile = DataDirectory+os.sep+ColName+"_append.csv"
+	if not os.path.isfile(AppendFile):
+		return None
+	DATA = pd.read_csv(AppendFile, index_col=0, parse_dates=True)
+	#Workbooks read integer headers as integers
+	DATA.columns = [int(C) if C.isdigit() else C for C in DATA.columns]
+	return DATA
+
+def RemoveAppended(DataDirectory, ColName):
+	'''Delete the rows appended to a workbook once it has been rewritten in full,
+	DataDirectory: Folder of processed data
+	ColName: The name of the workbook
+	Return,
+	1: If completes without error.'''
+	AppendFile = DataDirectory+os.sep+ColName+"_append.csv"
+	if os.path.isfile(AppendFile):
+		os.remove(AppendFile)
+	return 1
+
 def PCALOAD(Dir,Features):
 	''' Load individual files forming the dataframe for PCA
 	Dir: Directory of data
@@ -200,6 +248,53 @@ def WriteCacheFile(FileName, data_i):
 	return 1
 
 
+def SaveState(DataDirectory, FileName, State):
+	'''Write the checkpoint of an online anaylsis next to its results.
+	DataDirectory: Folder of processed data,
+	FileName: Feature name,
+	State: JSON dictionary,
+	Return,
+	1: If completes without error.
+	'''
+	return write_json(State, DataDirectory+os.sep+FileName+"_state.json")
+
+def LoadState(DataDirectory, FileName):
+	'''Read the checkpoint of an online anaylsis.
+	DataDirectory: Folder of processed data,
+	FileName: Feature name,
+	Return,
+	State: JSON dictionary or None if no checkpoint exists.
+	'''
+	StateFile = DataDirectory+os.sep+FileName+"_state.json"
+	if not os.path.isfile(StateFile):
+		return None
+	with open(StateFile) as json_file:
+		return json.load(json_file)
+
+def SaveArrays(DataDirectory, FileName, Arrays):
+	'''Write a dictionary of numpy arrays.
+	DataDirectory: Folder of processed data,
+	FileName: Feature name,
+	Arrays: Dictionary {key: array},
+	Return,
+	1: If completes without error.
+	'''
+	np.savez(DataDirectory+os.sep+FileName+".npz", **Arrays)
+	return 1
+
+def LoadArrays(DataDirectory, FileName):
+	'''Read a dictionary of numpy arrays.
+	DataDirectory: Folder of processed data,
+	FileName: Feature name,
+	Return,
+	Arrays: Dictionary {key: array} or None if the file does not exist.
+	'''
+	ArrayFile = DataDirectory+os.sep+FileName+".npz"
+	if not os.path.isfile(ArrayFile):
+		return None
+	with np.load(ArrayFile) as Arrays:
+		return dict(Arrays)
+
 def CheckExists(DataDirectory, CheckDirectory, FileName):
 	'''Check if file exists and then if sheet exists.
 	DataDirectory: Folder of raw data,
@@ -5,7 +5,9 @@ Contents:
 - Fitting
 - Fourier Transform
 - Spectrum Fit
+- Spectrogram Cache
 - Alpha Anaylsis
+- Wavelet Anaylsis
 
 Author: Joseph Walker j.j.walker@durham.ac.uk
 ============================================================================"""
@@ -17,6 +19,29 @@ import numdifftools as nd
 import pandas as pd
 
 Alpha_MinFreq = 0
+#BatchSize: Number of windows transformed together in AlphasProgress
+Alpha_BatchSize = 256
+#Spectrum: "Batch" real FFTs of all windows or "Sliding" DFT updates
+Alpha_Spectrum = "Batch"
+#SDFTAnchor: Steps between full FFTs re-anchoring the sliding DFT
+Alpha_SDFTAnchor = 256
+#AnalyticFit: Fit pink noise with closed form derivatives, 0 for numerical derivatives
+Alpha_AnalyticFit = 1
+#NBins: Number of logarithmic frequency bins the spectrum is averaged into before fitting, 0 fits every frequency
+Alpha_NBins = 0
+#Engine: "FFT" fits the spectrum of each window, "Wavelet" uses the Haar wavelet variance across scales
+Alpha_Engine = "FFT"
+#WaveletMinBlocks: Fewest blocks of the largest wavelet scale in a window
+Alpha_WaveletMinBlocks = 4
+#Hop: Fit every Hop-th window, rows between fits are filled
+Alpha_Hop = 1
+#HopFill: Filling of rows between fits, "ffill" or "interpolate"
+Alpha_HopFill = "ffill"
+#Estimator: "ChiSq" fits each window in turn, "LM" fits all windows of a batch together,
+#"LogLog" is an unweighted linear regression of log amplitude on log frequency
+Alpha_Estimator = "ChiSq"
+#LMMaxIter: Maximum Levenberg-Marquardt iterations of the batch fit
+Alpha_LMMaxIter = 100
 
 ################################################################################################################
 # Functions:
@@ -48,6 +73,37 @@ def modelSea(x, A, f, phase):
 	phase: phase offset'''
 	return A*np.cos(2.0*np.pi*x*f + phase)
 
+def ChiSqPink(Para, f, y, e):
+	'''ChiSq of the pink noise model and its gradient;
+	Para: [A, alpha]
+	f: f values,
+	y: y values,
+	e: errors
+	Returns,
+	chisq: ChiSq value
+	grad: Gradient [dA, dalpha]'''
+	fa = f**Para[1]
+	r = (y - Para[0]*fa)/e**2
+	dA = np.sum(r*fa)
+	dalpha = Para[0]*np.sum(r*fa*np.log(f))
+	return np.sum(r*(y - Para[0]*fa)), -2*np.array([dA, dalpha])
+
+def HessPink(Para, f, y, e):
+	'''Hessian of the pink noise ChiSq, sums are over the last axis so windows can be stacked;
+	Para: [A, alpha], or [(n,1), (n,1)] for n windows
+	f: f values,
+	y: y values, or (n, len(f)) for n windows
+	e: errors
+	Returns,
+	H: 2x2 Hessian, or (2,2,n) for n windows'''
+	fa = f**Para[1]
+	lf = np.log(f)
+	w = np.ones_like(f)/e**2
+	HAA = np.sum(w*fa**2, axis=-1)
+	HAa = np.sum(w*fa*lf*(2*Para[0]*fa - y), axis=-1)
+	Haa = np.sum(Para[0]*w*fa*lf**2*(2*Para[0]*fa - y), axis=-1)
+	return 2*np.array([[HAA, HAa], [HAa, Haa]])
+
 def modelPink(f, A, alpha):
 	'''Pink noise distribution;
 	f: f values,
@@ -78,6 +134,105 @@ def FourierTransform(Ys, units):
 
 	return fftfreq, AmpSpec, Series_phase
 
+def SpectrumGrid(WinSize, units):
+	'''Frequencies of a window used in the fit, and the real FFT bin holding each one,
+	WinSize: Number of points in the window
+	units: The tranformation into required units
+	Returns,
+	Fs: frequencies with fftfreq > Alpha_MinFreq
+	Bins: rfft bin of each frequency'''
+	fftfreq = scipy.fft.fftfreq(WinSize, 1/units)
+	Mask = fftfreq > Alpha_MinFreq
+	Bins = np.arange(WinSize)[Mask]
+	#Negative frequencies mirror the positive ones
+	Bins = np.minimum(Bins, WinSize - Bins)
+	return fftfreq[Mask], Bins
+
+def BatchSpectra(Ys, WinSize, Start, Stop, Bins, Hop=1):
+	'''Amplitude spectra of the sliding windows Ys[i:i+WinSize] for i in range(Start, Stop, Hop) from a single real FFT,
+	Ys : Data Y values must be equally spaced unit apart
+	WinSize: Number of points in each window
+	Start, Stop: Range of window start positions
+	Bins: rfft bins to return, from SpectrumGrid
+	Hop: Step between window start positions
+	Returns,
+	AmpSpec : Amplitude of frequency components, shape (len(range(Start, Stop, Hop)), len(Bins))'''
+	Ys = np.ascontiguousarray(Ys, dtype=np.float64)
+	#Zero copy view of all the windows
+	Windows = np.lib.stride_tricks.as_strided(Ys[Start:], shape=(len(range(Start, Stop, Hop)), WinSize), strides=(Hop*Ys.strides[0], Ys.strides[0]), writeable=False)
+	Series_psd = np.abs(scipy.fft.rfft(Windows, axis=1))
+	return 2*Series_psd[:,Bins]/WinSize
+
+
+class SlidingSpectrum:
+	'''Sliding DFT of the last WinSize points. Each new point updates the required bins in O(WinSize)
+	from the outgoing and incoming sample, with a full FFT every Anchor steps to limit numerical drift.
+	It lives for one AlphasWindows call, an incremental update starts afresh on its first new window.
+	'''
+	def __init__(self, WinSize, Bins, Anchor=None):
+		'''WinSize: Number of points in the window
+		Bins: rfft bins to track, from SpectrumGrid
+		Anchor: Steps between full FFTs, defaults to Alpha_SDFTAnchor'''
+		self.WinSize = WinSize
+		self.Bins = Bins
+		self.Anchor = Alpha_SDFTAnchor if Anchor == None else Anchor
+		self.Twiddle = np.exp(2j*np.pi*Bins/WinSize)
+		#Circular buffer of the window, oldest point at Head
+		self.Window = np.zeros(WinSize)
+		self.Head = 0
+		self.Steps = 0
+		self.NaNs = 0
+		self.X = np.zeros(len(Bins), dtype=complex)
+
+	def start(self, Ys):
+		'''Initialise on a full window,
+		Ys: The first WinSize data points'''
+		self.Window[:] = Ys
+		self.Head = 0
+		self.NaNs = int(np.sum(np.isnan(self.Window)))
+		self.reanchor()
+
+	def reanchor(self):
+		'''Recompute the tracked bins exactly with a real FFT.'''
+		Ordered = np.roll(self.Window, -self.Head)
+		self.X = scipy.fft.rfft(Ordered)[self.Bins]
+		self.Steps = 0
+
+	def push(self, y):
+		'''Slide the window on by one point,
+		y: The new data point'''
+		Old = self.Window[self.Head]
+		self.Window[self.Head] = y
+		self.Head = (self.Head + 1) % self.WinSize
+		self.NaNs += int(np.isnan(y)) - int(np.isnan(Old))
+		self.Steps += 1
+		if self.Steps >= self.Anchor or (np.isnan(Old) and self.NaNs == 0):
+			self.reanchor()
+		else:
+			self.X = (self.X - Old + y) * self.Twiddle
+
+	def amplitudes(self):
+		'''Amplitude spectrum of the current window, matching FourierTransform.'''
+		return 2*np.abs(self.X)/self.WinSize
+
+def LogBinSpectrum(Fs, As, errs, NBins):
+	'''Average an amplitude spectrum into logarithmically spaced frequency bins, empty bins are dropped,
+	Fs: Increasing frequencies
+	As: Amplitude of frequency components, or one row per window
+	errs: errors on As
+	NBins: Number of bins spanning Fs
+	Returns,
+	FsBinned: Geometric mean frequency of each bin
+	AsBinned: Mean amplitude of each bin
+	errsBinned: Propagated error on the mean amplitude'''
+	Edges = np.logspace(np.log10(Fs[0]), np.log10(Fs[-1]), NBins+1)
+	Index = np.clip(np.searchsorted(Edges, Fs, side="right")-1, 0, NBins-1)
+	Starts = np.flatnonzero(np.diff(Index, prepend=-1))
+	Counts = np.diff(np.append(Starts, len(Fs)))
+	FsBinned = np.exp(np.add.reduceat(np.log(Fs), Starts)/Counts)
+	AsBinned = np.add.reduceat(As, Starts, axis=-1)/Counts
+	errsBinned = np.sqrt(np.add.reduceat(np.broadcast_to(errs, Fs.shape)**2, Starts))/Counts
+	return FsBinned, AsBinned, errsBinned
 
 ######################
 # Spectrum Fit:
@@ -93,12 +248,18 @@ def FitPink(Fs, As, errs, units, guess = [1,-1]):
 	PPink: Fitted Spectrum [A, Alpha]
 	PPinkErr: Fitted Spectrum Errors [A, Alpha]'''
 	#Fit Pink Noise
-	R = minimize(lambda Para,x=Fs,y=As,e=errs: ChiSqFunc(y,modelPink(x,Para[0],Para[1]),e), guess, bounds=[(0,None),(-2,2)], options={'gtol': 1e-6, 'disp': False})
+	if Alpha_AnalyticFit:
+		R = minimize(ChiSqPink, guess, args=(Fs, As, errs), jac=True, bounds=[(0,None),(-2,2)], options={'gtol': 1e-6, 'disp': False})
+	else:
+		R = minimize(lambda Para,x=Fs,y=As,e=errs: ChiSqFunc(y,modelPink(x,Para[0],Para[1]),e), guess, bounds=[(0,None),(-2,2)], options={'gtol': 1e-6, 'disp': False})
 	PPink = R.x 
 	chisqvalue = R.fun #chisqmin
 	chisqreduced = chisqvalue/(len(Fs)-len(PPink))
 
-	H = nd.Hessian(lambda Para,x=Fs,y=As,e=errs: ChiSqFunc(y,modelPink(x,Para[0],Para[1]),e))([PPink[0],PPink[1]])
+	if Alpha_AnalyticFit:
+		H = HessPink(PPink, Fs, As, errs)
+	else:
+		H = nd.Hessian(lambda Para,x=Fs,y=As,e=errs: ChiSqFunc(y,modelPink(x,Para[0],Para[1]),e))([PPink[0],PPink[1]])
 	if np.isnan(np.sum(H)) == False and np.linalg.det(H) != 0:
 		ErrorM = scipy.linalg.inv(H/2)
 		PPinkErrs = np.array( [abs(ErrorM[0,0])**0.5,abs(ErrorM[1,1])**0.5] )
@@ -108,40 +269,381 @@ def FitPink(Fs, As, errs, units, guess = [1,-1]):
 		
 	return PPink, PPinkErrs
 
+def FitPinkBatch(Fs, As, errs, units, guess = None):
+	'''Function to fit distribution to pink noise in many windows at once, by damped Gauss-Newton
+	(Levenberg-Marquardt) steps on every window together within the bounds used by FitPink;
+	Fs: frequencies
+	As: Amplitudes of frequency components, one row per window
+	errs: errors on As
+	units: convert to appropiate units
+	guess: Inital [A, Alpha] for every window, default is the best of a grid of alphas
+	Returns,
+	PPink: Fitted Spectra, one [A, Alpha] row per window
+	PPinkErr: Fitted Spectra Errors, one [A, Alpha] row per window'''
+	As = np.atleast_2d(As)
+	NWindows = As.shape[0]
+	w = np.ones_like(Fs)/errs**2
+	lf = np.log(Fs)
+	ChiSq = lambda A, alpha, y: np.sum(w*(y - A[:,None]*Fs**alpha[:,None])**2, axis=1)
+
+	if guess is None:
+		#Amplitude is linear so solve it exactly for each alpha on the grid
+		Grid = np.linspace(-2, 2, 41)
+		fa = Fs**Grid[:,None]
+		Sfy = As @ (w*fa).T
+		Sff = np.sum(w*fa**2, axis=1)
+		A = np.maximum(Sfy/Sff, 0)
+		ChiSqs = np.sum(w*As**2, axis=1)[:,None] - 2*A*Sfy + A**2*Sff
+		Best = np.argmin(np.nan_to_num(ChiSqs, nan=np.inf), axis=1)
+		A, alpha = A[np.arange(NWindows), Best], Grid[Best]
+	else:
+		A, alpha = np.full(NWindows, float(guess[0])), np.full(NWindows, float(guess[1]))
+	Chisq = ChiSq(A, alpha, As)
+	Lambda = np.full(NWindows, 1e-3)
+	Active = np.isfinite(Chisq)
+
+	for Iter in range(Alpha_LMMaxIter):
+		if not Active.any():
+			break
+		Idx = np.flatnonzero(Active)
+		a, al, y, L = A[Idx], alpha[Idx], As[Idx], Lambda[Idx]
+		#Jacobian of the model and the Gauss-Newton normal equations
+		JA = Fs**al[:,None]
+		Ja = a[:,None]*JA*lf
+		r = w*(y - a[:,None]*JA)
+		gA, ga = np.sum(r*JA, axis=1), np.sum(r*Ja, axis=1)
+		HAA, HAa, Haa = np.sum(w*JA**2, axis=1), np.sum(w*JA*Ja, axis=1), np.sum(w*Ja**2, axis=1)
+		DAA, Daa = HAA*(1+L), Haa*(1+L)
+		Det = DAA*Daa - HAa**2
+		#Project the step onto the bounds
+		NewA = np.maximum(a + (Daa*gA - HAa*ga)/Det, 0)
+		Newal = np.clip(al + (DAA*ga - HAa*gA)/Det, -2, 2)
+		NewChisq = ChiSq(NewA, Newal, y)
+		Better = NewChisq < Chisq[Idx]
+		Converged = Better & (Chisq[Idx] - NewChisq <= 1e-12*Chisq[Idx])
+
+		A[Idx[Better]], alpha[Idx[Better]], Chisq[Idx[Better]] = NewA[Better], Newal[Better], NewChisq[Better]
+		Lambda[Idx] = np.where(Better, L/10, L*10)
+		Active[Idx[Converged | (Lambda[Idx] > 1e10)]] = False
+
+	#Errors from the full Hessian
+	H = HessPink([A[:,None], alpha[:,None]], Fs, As, errs)/2
+	Det = H[0,0]*H[1,1] - H[0,1]**2
+	PPink = np.stack([A, alpha], axis=1)
+	with np.errstate(divide="ignore", invalid="ignore"):
+		PPinkErrs = np.stack([np.abs(H[1,1]/Det)**0.5, np.abs(H[0,0]/Det)**0.5], axis=1)
+	Failed = ~np.isfinite(Det) | (Det == 0)
+	PPinkErrs[Failed] = np.inf
+	PPink[Failed] = 0
+	return PPink, PPinkErrs
+
+def FitPinkLogLog(Fs, As, errs, units):
+	'''Fast estimate of the pink noise distribution in many windows at once, by linear regression of log(As)
+	on log(Fs) with closed form parameters. The scatter of a log amplitude is about constant over a periodogram,
+	so points are weighted equally and the errors come from the residual variance of each window;
+	Fs: frequencies
+	As: Amplitudes of frequency components, one row per window
+	errs: errors on As, unused as the weights are uniform
+	units: convert to appropiate units
+	Returns,
+	PPink: Fitted Spectra, one [A, Alpha] row per window
+	PPinkErr: Fitted Spectra Errors, one [A, Alpha] row per window'''
+	As = np.atleast_2d(As)
+	x = np.log(Fs)
+	#Non positive amplitudes have no log and are left out
+	w = (As > 0).astype(float)
+	y = np.log(np.where(As > 0, As, 1))
+	S, Sx, Sxx = np.sum(w, axis=1), w @ x, w @ x**2
+	Sy, Sxy = np.sum(w*y, axis=1), np.sum(w*y*x, axis=1)
+	Det = S*Sxx - Sx**2
+	with np.errstate(divide="ignore", invalid="ignore"):
+		alpha = (S*Sxy - Sx*Sy)/Det
+		c = (Sxx*Sy - Sx*Sxy)/Det
+		#Residual variance of log(As) about the line
+		Var = np.sum(w*(y - c[:,None] - alpha[:,None]*x)**2, axis=1)/(S-2)
+		PPink = np.stack([np.exp(c), alpha], axis=1)
+		PPinkErrs = np.stack([PPink[:,0]*np.sqrt(Var*Sxx/Det), np.sqrt(Var*S/Det)], axis=1)
+	Failed = ~np.isfinite(Det) | (Det <= 0) | (S <= 2)
+	PPinkErrs[Failed] = np.inf
+	PPink[Failed] = 0
+	return PPink, PPinkErrs
+
+######################
+# Spectrogram Cache:
+######################
+
+def SpectrumFit(Ys, units, errs):
+	'''Amplitude spectrum of a window and its pink noise fit, as shown in the Fourier tab;
+	Ys : Data Y values must be equally spaced unit apart
+	units: The tranformation into required units
+	errs: errors on the amplitudes
+	Returns,
+	Fs: Positive frequencies
+	As: Amplitude of the positive frequencies
+	PPink: Fitted Spectrum [A, Alpha]
+	PPinkErr: Fitted Spectrum Errors [A, Alpha]'''
+	fftfreq, AmpSpec, _ = FourierTransform(Ys, units)
+	FsFit, AsFit, errsFit = fftfreq[fftfreq > Alpha_MinFreq], AmpSpec[fftfreq > Alpha_MinFreq], errs
+	if Alpha_NBins > 0 and len(FsFit) > 0:
+		FsFit, AsFit, errsFit = LogBinSpectrum(FsFit, AsFit, errs, Alpha_NBins)
+	PPink, PPinkErrs = FitPink(FsFit, AsFit, errsFit, units)
+	return fftfreq[fftfreq > 0], AmpSpec[fftfreq > 0], np.asarray(PPink, dtype=float), PPinkErrs
+
+def SpectrumBins(NFreqs, NPoints):
+	'''First frequency of each logarithmic bin a spectrum is averaged into for display, low frequencies are kept one per bin;
+	NFreqs: Number of positive frequencies
+	NPoints: Most bins kept, 0 keeps every frequency
+	Returns,
+	Starts: Index of the first frequency of each bin'''
+	if NPoints <= 0 or NFreqs <= NPoints:
+		return np.arange(NFreqs)
+	return np.unique((np.logspace(0, np.log10(NFreqs+1), NPoints+1)[:-1]).astype(int)-1)
+
+def Spectrogram(Ys, units, errs, NGrid, NPoints):
+	'''Spectra and fits of every window between two points of a grid spanning the data. Only the amplitudes averaged into at
+	most NPoints logarithmic bins and the fit are kept, the frequencies follow from the window and units;
+	Ys : Data Y values must be equally spaced unit apart
+	units: The tranformation into required units
+	errs: errors on the amplitudes
+	NGrid: Number of grid intervals
+	NPoints: Most frequency bins kept per window, 0 keeps every frequency
+	Returns,
+	Cache: Dictionary of arrays, "Grid" of window edges, "units", "NPoints" and "As_a_b", "Fit_a_b" for the window Ys[Grid[a]:Grid[b]]'''
+	Grid = np.unique(np.linspace(0, len(Ys), NGrid+1).round().astype(int))
+	Cache = {"Grid": Grid, "units": np.array(units, dtype=float), "NPoints": np.array(NPoints)}
+	for a in range(len(Grid)):
+		for b in range(a+1, len(Grid)):
+			Fs, As, PPink, PPinkErrs = SpectrumFit(Ys[Grid[a]:Grid[b]], units, errs)
+			Starts = SpectrumBins(len(As), NPoints)
+			Cache["As_%s_%s" % (a,b)] = np.add.reduceat(As, Starts)/np.diff(np.append(Starts, len(As))) if len(As) > 0 else As
+			Cache["Fit_%s_%s" % (a,b)] = np.append(PPink, PPinkErrs)
+	return Cache
+
+def LookupSpectrum(Cache, Start, Stop):
+	'''Spectrum and fit of the cached window nearest to Ys[Start:Stop];
+	Cache: Dictionary returned by Spectrogram
+	Start, Stop: Window of the data requested
+	Returns,
+	Fs: Positive frequencies, geometric mean of each bin
+	As: Mean amplitude of each bin
+	PPink: Fitted Spectrum [A, Alpha]
+	PPinkErr: Fitted Spectrum Errors [A, Alpha]'''
+	Grid = Cache["Grid"]
+	a = int(np.argmin(np.abs(Grid[:-1]-Start)))
+	b = a+1+int(np.argmin(np.abs(Grid[a+1:]-Stop)))
+	Fit = Cache["Fit_%s_%s" % (a,b)]
+	As = Cache["As_%s_%s" % (a,b)]
+	#Frequencies of the window, as in SpectrumFit
+	Fs = scipy.fft.fftfreq(int(Grid[b]-Grid[a]), 1/float(Cache["units"]))
+	Fs = Fs[Fs > 0]
+	Starts = SpectrumBins(len(Fs), int(Cache["NPoints"]))
+	if len(Starts) < len(Fs):
+		Fs = np.exp(np.add.reduceat(np.log(Fs), Starts)/np.diff(np.append(Starts, len(Fs))))
+	return Fs, As, Fit[:2], Fit[2:]
+
 ######################
 # Alpha Anaylsis:
 ######################
 
-def AlphasProgress(data, WinSize, errs, units, Name):
-	'''Sliding window anaysis of data, spectrum is fit to A*f^alpha model, then run through bayesian online change point detection;
+def AlphasWindows(data, WinSize, errs, units, First, Last, guess = [1,-1], Hop = 1):
+	'''Fit the spectra of the sliding windows data[i:i+WinSize] for i in range(First, Last, Hop) to the A*f^alpha model;
 	data: Raw data of variable,
 	WinSize: Int number of data points corresponding to the desired window size,
+	errs: errors on the amplitudes,
 	units: convert to appropiate units,
+	First, Last: Range of window start positions,
+	guess: Inital [A, Alpha] of the first window,
+	Hop: Step between fitted windows
+	Return,
+	PinkWindows: Array of [PPink, PPinkErrs] for each fitted window, shape (len(range(First, Last, Hop)), 2, 2)'''
+	NFits = len(range(First, Last, Hop))
+	PinkWindows = np.zeros((NFits, 2, 2)) - np.inf
+	#Frequency grid is the same for every window
+	Fs, Bins = SpectrumGrid(WinSize, units)
+	FsFit, errsFit = Fs, errs
+	if Alpha_NBins > 0 and len(Fs) > 0:
+		FsFit, _, errsFit = LogBinSpectrum(Fs, Fs, errs, Alpha_NBins)
+	if Alpha_Spectrum == "Sliding" and NFits > 0:
+		Spectrum = SlidingSpectrum(WinSize, Bins)
+		Spectrum.start(data[First:First+WinSize])
+		Position = First
+	for Batch in range(0, NFits, Alpha_BatchSize):
+		BatchEnd = min(Batch+Alpha_BatchSize, NFits)
+		Start, Stop = First+Batch*Hop, First+(BatchEnd-1)*Hop+1
+		if Alpha_Spectrum == "Sliding":
+			AmpSpecs = np.zeros((BatchEnd-Batch, len(Bins)))
+			for k, i in enumerate(range(Start, Stop, Hop)):
+				#The sliding spectrum sees every point
+				while Position < i:
+					Position += 1
+					Spectrum.push(data[Position+WinSize-1])
+				AmpSpecs[k] = Spectrum.amplitudes()
+		else:
+			AmpSpecs = BatchSpectra(data, WinSize, Start, Stop, Bins, Hop)
+		if Alpha_NBins > 0:
+			_, AmpSpecs, _ = LogBinSpectrum(Fs, AmpSpecs, errs, Alpha_NBins)
+		if Alpha_Estimator != "ChiSq":
+			#Fit the whole batch together
+			Fit = FitPinkLogLog if Alpha_Estimator == "LogLog" else FitPinkBatch
+			PPinks, PPinkErrs = Fit(FsFit, AmpSpecs, errsFit, units)
+			PinkWindows[Batch:BatchEnd,0] = PPinks
+			PinkWindows[Batch:BatchEnd,1] = PPinkErrs
+		else:
+			for k in range(Batch, BatchEnd):
+				#Fit Seasonality
+				PPink, PPinkErrs = FitPink(FsFit, AmpSpecs[k-Batch], errsFit, units, guess)
+				PinkWindows[k,0] = PPink
+				PinkWindows[k,1] = PPinkErrs
+				#Use previous solution to help
+				guess = PPink
+	return PinkWindows
+
+def FillHops(df, Name):
+	'''Fill the rows between fitted windows from the "Fitted" flag, by Alpha_HopFill;
+	df: Dataframe of rolling window Alphas, fitting errors and the "Fitted" flag
 	Name: The varible name
 	Return,
-	df: Dataframe of rolling window Alphas and fitting errors '''
-	#Do with control regions
-	NPoints = len(data)
-	PinkWindows = np.zeros((NPoints,2, 2)) - np.inf
-	guess = [1,-1] #Inital guess
-	for i in range(NPoints-WinSize):
-		fftfreq, AmpSpec, Series_phase = FourierTransform(data[i:i+WinSize], units) 
-		Fs = fftfreq[fftfreq>Alpha_MinFreq]
-		As = AmpSpec[fftfreq>Alpha_MinFreq]
-		#Fit Seasonality
-		PPink, PPinkErrs = FitPink(Fs, As, errs, units, guess)
-		PinkWindows[i+WinSize,0] = PPink
-		PinkWindows[i+WinSize,1] = PPinkErrs
-		#Use previous solution to help
-		guess = PPink
-		
-		
+	df: Filled Dataframe'''
+	Fitted = df["Fitted"].values.astype(bool)
+	#Rows before the first fit keep their value
+	Between = ~Fitted & (np.cumsum(Fitted) > 0)
+	Cols = [Name, "Error"]
+	df.loc[Between, Cols] = np.nan
+	if Alpha_HopFill == "interpolate":
+		df[Cols] = df[Cols].interpolate(method="linear", limit_area="inside")
+	df[Cols] = df[Cols].ffill()
+	return df
+
+def AlphasFrame(PinkWindows, Name):
+	'''Dataframe of the rolling window Alphas, when Alpha_Hop > 1 rows not fitted are nan and get filled;
+	PinkWindows: Array of [PPink, PPinkErrs] for each data point
+	Name: The varible name
+	Return,
+	df: Dataframe of rolling window Alphas and fitting errors, and the "Fitted" flag when Alpha_Hop > 1 '''
 	df = pd.DataFrame(
 		data = { Name: PinkWindows[:,0,1],
 			"Error" : PinkWindows[:,1,1],
 		}, 
 	)
+	if Alpha_Hop > 1:
+		df["Fitted"] = ~np.isnan(PinkWindows[:,1,1]) & (PinkWindows[:,1,1] > -np.inf)
+		df = FillHops(df, Name)
 	return df
 
+def AlphasProgress(data, WinSize, errs, units, Name):
+	'''Sliding window anaysis of data, spectrum is fit to A*f^alpha model, then run through bayesian online change point detection;
+	data: Raw data of variable,
+	WinSize: Int number of data points corresponding to the desired window size,
+	units: convert to appropiate units,
+	Name: The varible name
+	Return,
+	df: Dataframe of rolling window Alphas and fitting errors '''
+	if Alpha_Engine == "Wavelet":
+		return AlphasWavelet(data, WinSize, Name)
+	#Do with control regions
+	NPoints = len(data)
+	PinkWindows = np.zeros((NPoints,2, 2)) - np.inf
+	if NPoints > WinSize:
+		#Window i ends the point before row i+WinSize
+		PinkWindows[WinSize:] = np.nan
+		PinkWindows[WinSize::Alpha_Hop] = AlphasWindows(data, WinSize, errs, units, 0, NPoints-WinSize, Hop=Alpha_Hop)
+	return AlphasFrame(PinkWindows, Name)
+
+def AlphasSettings():
+	'''Settings the stored Alphas depend on, checkpointed so that a change refits every window;
+	Return,
+	Settings: Dictionary {setting: value} '''
+	return {
+		"Alpha_Estimator" : Alpha_Estimator,
+		"Alpha_Engine" : Alpha_Engine,
+		"Alpha_NBins" : int(Alpha_NBins),
+		"Alpha_MinFreq" : float(Alpha_MinFreq),
+		"Alpha_Hop" : int(Alpha_Hop),
+		"Alpha_HopFill" : Alpha_HopFill,
+	}
+
+def AlphasState(data, WinSize, errs, units, LastTime, errsTime = None, guess = None):
+	'''Checkpoint of AlphasProgress over data so that appended rows can be fitted on their own;
+	data: Raw data of variable,
+	WinSize: Int number of data points corresponding to the desired window size,
+	errs: errors on the amplitudes the windows were fitted with,
+	units: convert to appropiate units,
+	LastTime: Timestamp of the last row of data,
+	errsTime: Timestamp of the last row errs was averaged over, defaults to LastTime
+	guess: Fit of the last fitted window, refitted if None
+	Return,
+	State: JSON compatible dictionary '''
+	if errsTime is None:
+		errsTime = LastTime
+	NPoints = len(data)
+	if guess is None:
+		guess = [1,-1]
+		if NPoints > WinSize:
+			#Warm start for the next update from the last fitted window
+			Last = (NPoints-WinSize-1)//Alpha_Hop*Alpha_Hop
+			guess = AlphasWindows(data, WinSize, errs, units, Last, Last+1)[-1,0]
+	State = {"LastTime": "%s" % LastTime, "Window": int(WinSize), "Guess": [float(G) for G in guess], "errs": float(errs), "errsTime": "%s" % errsTime}
+	State.update(AlphasSettings())
+	return State
+
+######################
+# Wavelet Anaylsis:
+######################
+
+def AlphasWavelet(data, WinSize, Name):
+	'''Sliding window anaysis of data by the Haar wavelet variance. For an amplitude spectrum A*f^alpha the variance
+	of the wavelet coefficients at scale 2^j grows as 2^(-2*alpha*j), so alpha is minus half the slope of log2 variance against j.
+	Cumulative sums give the variance of every window in O(len(data)) per scale. The nominal error of the weights
+	is inflated by the root reduced chi squared of each window's fit where it exceeds one;
+	data: Raw data of variable,
+	WinSize: Int number of data points corresponding to the desired window size,
+	Name: The varible name
+	Return,
+	df: Dataframe of rolling window Alphas and fitting errors '''
+	data = np.asarray(data, dtype=float)
+	NPoints = len(data)
+	PinkWindows = np.zeros((NPoints,2, 2)) - np.inf
+	Scales = 2**np.arange(1, int(np.log2(max(WinSize/Alpha_WaveletMinBlocks, 1)))+1)
+	if NPoints <= WinSize or len(Scales) < 2:
+		return AlphasFrame(PinkWindows, Name)
+
+	#Prefix sums of the data and of the missing points
+	Missing = np.isnan(data)
+	C = np.append(0, np.cumsum(np.where(Missing, 0, data)))
+	M = np.append(0, np.cumsum(Missing))
+	#Window of row p is data[p-WinSize:p]
+	Rows = np.arange(WinSize, NPoints)
+	LogVar = np.zeros((len(Rows), len(Scales)))
+	for j, L in enumerate(Scales):
+		#Coefficient of the block data[e-L:e]
+		e = np.arange(L, NPoints+1)
+		d2 = (C[e] - 2*C[e-L//2] + C[e-L])**2/L
+		Valid = M[e] == M[e-L]
+		Sd2 = np.append(0, np.cumsum(np.where(Valid, d2, 0)))
+		Sn = np.append(0, np.cumsum(Valid))
+		#Blocks inside the window end at p-WinSize+L <= e <= p
+		Lo, Hi = Rows-WinSize, Rows-L+1
+		with np.errstate(divide="ignore", invalid="ignore"):
+			LogVar[:,j] = np.log2((Sd2[Hi]-Sd2[Lo])/(Sn[Hi]-Sn[Lo]))
+
+	#Weighted regression on the scale, log2 variance of n blocks has variance 2/(n ln(2)^2)
+	x = np.arange(1, len(Scales)+1)
+	w = (WinSize/Scales)*np.log(2)**2/2
+	S, Sx, Sxx = np.sum(w), np.sum(w*x), np.sum(w*x**2)
+	Det = S*Sxx - Sx**2
+	Sy, Sxy = LogVar @ w, LogVar @ (w*x)
+	Slope = (S*Sxy - Sx*Sy)/Det
+	Alpha, AlphaErr = -Slope/2, np.full(len(Rows), np.sqrt(S/Det)/2)
+	if len(Scales) > 2:
+		#Inflate the nominal error where a window scatters about its line more than the weights expect
+		Intercept = (Sxx*Sy - Sx*Sxy)/Det
+		ChiSq = (LogVar - Intercept[:,None] - Slope[:,None]*x)**2 @ w
+		AlphaErr *= np.fmax(np.sqrt(ChiSq/(len(Scales)-2)), 1)
+	Failed = ~np.isfinite(Alpha)
+	Alpha[Failed], AlphaErr[Failed] = 0, np.inf
+	PinkWindows[WinSize:,0,1] = Alpha
+	PinkWindows[WinSize:,1,1] = AlphaErr
+	return AlphasFrame(PinkWindows, Name)
+
 if __name__ == "__main__":
 	print("Run as module") 
@@ -4,7 +4,11 @@ Module containing relevent PCA tools
 Contents:
 - PCA Confidence limit funcs
 - RegionSlicer On Confidence
+- PCA scoring kernel
+- PCA result buffers
 - PCA
+- Rolling covariance PCA
+- Batched PCA
 
 Author: Joseph Walker j.j.walker@durham.ac.uk
 ============================================================================"""
@@ -16,6 +20,9 @@ from sklearn import decomposition
 from sklearn.preprocessing import StandardScaler
 from datetime import timedelta
 
+#Stats has no app dependencies and is needed from every entry point
+from . import Stats
+
 import os
 import sys
 if sys.argv[0] == "JustRun.py":
@@ -25,6 +32,17 @@ if sys.argv[0].split(os.sep)[-1] == "app.py":
 
 Rolling_WindowUnit = "week"
 Rolling_Window = 1
+#PCA_Engine: "sklearn" refits StandardScaler and PCA for every row, "Rolling" updates a running covariance,
+#"Batch" decomposes all window covariances together for offline runs
+PCA_Engine = "sklearn"
+#PCA_Recompute: Running covariance updates between exact recomputes
+PCA_Recompute = 1000
+#PCA_RefitEvery: Rows scored by each model before it is refitted
+PCA_RefitEvery = 1
+#PCA_BatchChunk: Most rows scored per batched decomposition of the "Batch" engine, fewer when the window is shorter
+PCA_BatchChunk = 2048
+#PCA_Float32: Store the PCA results in single precision, the statistics are still computed in double
+PCA_Float32 = 0
 
 ################################################################################################################
 # Functions:
@@ -46,8 +64,11 @@ def PValue(Mean,SD,Xmin,Xmax):
 	Mean: Gaussian center,
 	SD: Standard Deviation,
 	Xmin: Integral lower limit,
-	Xmax: Integral lower limit'''
-	return scipy.integrate.quad(lambda x: Gaussian(Mean,SD,x), Xmin,Xmax)
+	Xmax: Integral lower limit
+	Return,
+	P: The P value,
+	err: Zero, kept from the numerical integral this replaced'''
+	return Stats.NormInterval(Xmin, Xmax, Mean, SD)[()], 0.0
 
 #######################
 # PCA Confidence limit funcs
@@ -71,26 +92,16 @@ def QLimInv(Qs, theta):
 	Z: Z score,
 	Pval: The P value,
 	'''
-	if np.sum(theta) != 0:
+	#Element wise, thetas may be arrays broadcasting against Qs
+	theta = [np.asarray(t, dtype=float) for t in theta]
+	Valid = np.sum(theta, axis=0) != 0
+	with np.errstate(divide="ignore", invalid="ignore"):
 		h0 = 1 - ((2*theta[0]*theta[2])/(3*theta[1]**2))
 		A = (Qs/theta[0])**(h0) - 1
 		B = (theta[1]*h0*(h0-1))/theta[0]
 		C = 1/(h0*np.sqrt(2*theta[1]))
-		Z = C*(A*theta[0] - B)
-		if isinstance(Qs, (list, tuple, np.ndarray)):
-			Ps = np.zeros(len(Qs))
-			for i in range(len(Qs)):
-				Ps[i] = PValue(0,1,Z[i] ,np.inf)[0]
-			return Z, Ps
-		else:
-			return Z, PValue(0,1,Z ,np.inf)[0]
-	else:
-		if isinstance(Qs, (list, tuple, np.ndarray)):
-			Ps = np.ones(len(Qs))
-			Z = np.zeros(len(Qs)) + -np.inf
-			return Z, Ps
-		else:
-			return -np.inf,1
+		Z = np.where(Valid, C*(A*theta[0] - B), -np.inf)
+	return Z[()], np.where(Valid, Stats.NormSf(Z), 1.0)[()]
 
 def TLimFunc(Zs,NPCA,n):
 	'''t squared hotteling statistic for PCA model of desired confidence;
@@ -100,13 +111,8 @@ def TLimFunc(Zs,NPCA,n):
 	Return
 	t: The tsq value for this Z score and given model.
 	'''
-	if isinstance(Zs, (list, tuple, np.ndarray)):
-		alpha = np.zeros(len(Zs))
-		for i in range(len(Zs)):
-			alpha[i] = PValue(0,1,-np.inf ,Zs[i])[0]
-	else:
-		alpha = PValue(0,1,-np.inf ,Zs)[0]
-	Val = scipy.stats.f.ppf(q=alpha, dfn=NPCA, dfd=n-NPCA)* ((( n*n - 1 )*NPCA) / (n*(n-NPCA)))
+	alpha = Stats.NormCdf(Zs)
+	Val = Stats.FPpf(alpha, NPCA, n-NPCA)* ((( n*n - 1 )*NPCA) / (n*(n-NPCA)))
 	return Val
 
 def TLimInv(Val, NPCA,n):
@@ -117,8 +123,7 @@ def TLimInv(Val, NPCA,n):
 	Return
 	Pval: The P value,
 	'''
-	Perc = scipy.stats.f.cdf(x=Val/ ((( n*n - 1 )*NPCA) / (n*(n-NPCA))), dfn=NPCA, dfd=n-NPCA)
-	return 1-Perc
+	return Stats.FSf(Val/ ((( n*n - 1 )*NPCA) / (n*(n-NPCA))), NPCA, n-NPCA)
 
 #######################
 # RegionSlicer On Confidence
@@ -235,6 +240,81 @@ def PCARegionsCollect(Ts, Qs, dtMeasure, AlphaLim, NPCA, TestCol, NDur=0):
 	return HighlightedAll, HighlightedSpecific, dfRatesAll, dfRatesSpecific 
 
 
+#######################
+# PCA scoring kernel
+#######################
+
+def PCAScores(Rescaled, Components, Variance, NPCA, window, Center=None):
+	''' T squared and Q statistics, overall and for each feature alone, of a block of rows sharing one model,
+	or of rows each with their own model when Components and Variance are stacked per row.
+	Rescaled: Scaled rows, shape (m, d)
+	Components: Principal axes as rows, by decreasing variance, shape (d, d) or (m, d, d)
+	Variance: Variance of each component, shape (d,) or (m, d)
+	NPCA: The dimensionality of the model used, 
+	window: The number of points the model was fitted on
+	Center: Mean removed by the PCA transform, zero by default
+	Return,
+	Ts: P values of the t squared hotelling statistic, overall then each feature, shape (m, d+1)
+	Qs: P values of the Q resisduals statistic, overall then each feature, shape (m, d+1)
+	'''
+	Rescaled = np.atleast_2d(Rescaled)
+	Loadings = Components[...,:NPCA,:]
+	eigenvalues = Variance[...,:NPCA]
+	Residual = Variance[...,NPCA:]
+	theta = [np.sum(Residual, axis=-1, keepdims=True), np.sum(Residual**2, axis=-1, keepdims=True), np.sum(Residual**3, axis=-1, keepdims=True)]
+	c = np.zeros(NPCA) if Center is None else Loadings @ Center
+
+	Transformed = (Loadings @ Rescaled[:,:,None])[:,:,0] - c
+	T = np.sum(Transformed**2/eigenvalues, axis=1)
+	Q = np.abs(np.sum(Rescaled**2, axis=1) - np.sum(Transformed**2, axis=1))
+
+	#Feature i alone transforms to Rescaled[:,i]*Loadings[:,i] - c
+	A = np.sum(Loadings**2/eigenvalues[...,None], axis=-2)
+	B = ((c/eigenvalues)[...,None,:] @ Loadings)[...,0,:]
+	U = np.sum(Loadings**2, axis=-2)
+	V = c @ Loadings
+	TE = Rescaled**2*A - 2*Rescaled*B + np.sum(c**2/eigenvalues, axis=-1, keepdims=True)
+	QE = np.abs(Rescaled**2 - (Rescaled**2*U - 2*Rescaled*V + c @ c))
+
+	Ts = TLimInv(np.column_stack([T, TE]), NPCA, window)
+	Qs = QLimInv(np.column_stack([Q, QE]), theta)[1]
+	return Ts, Qs
+
+#######################
+# PCA result buffers
+#######################
+
+def PCABuffers(Rows, Cols):
+	''' Contiguous arrays the PCA engines write their results into, float32 when PCA_Float32 is set;
+	Rows: Number of rows scored
+	Cols: Number of features
+	Return,
+	Data: Scaled variables, shape (Rows, Cols)
+	Ts: T squared P values, overall and individual, shape (Rows, Cols+1)
+	Qs: Q resisdual P values, overall and individual, shape (Rows, Cols+1)
+	Variances: Fractional variance in each component, shape (Rows, Cols)
+	'''
+	dtype = np.float32 if PCA_Float32 else np.float64
+	return np.zeros((Rows,Cols), dtype), np.zeros((Rows,Cols+1), dtype), np.zeros((Rows,Cols+1), dtype), np.zeros((Rows,Cols), dtype)
+
+def PCAFrames(df, Data, Ts, Qs, Variances):
+	''' Wrap the PCA result arrays in dataframes once the run is complete;
+	df: The differenced dataframe that was scored
+	Data, Ts, Qs, Variances: Arrays returned by PCABuffers
+	Return,
+	Data: Scaled variables
+	Ts: The t squared hotelling statistic df. Overall and individual
+	Qs: The Q resisduals statistic df. Overall and individual
+	Variances: The fractional variance in each component over time
+	'''
+	Cols = list(df.columns)
+	return (
+		pd.DataFrame( data = Data, columns = Cols, index=df.index, copy=False ),
+		pd.DataFrame( data = Ts, columns = ["Ts"] + Cols, index=df.index, copy=False ),
+		pd.DataFrame( data = Qs, columns = ["Qs"] + Cols, index=df.index, copy=False ),
+		pd.DataFrame( data = Variances, columns = ["%s" % C for C in range(len(Cols))], index=df.index, copy=False ),
+	)
+
 #######################
 # PCA
 #######################
@@ -251,108 +331,265 @@ def PCA(df, NPCA, window):
 	Variances: The fractional variance in each component over time
 	'''
 	df = df.diff(1).iloc[1:,:]
-	Rows, Cols = df.shape[0], df.shape[1]
-	
-	
-	## #First fit over the window
-	DATA = df.iloc[:window,:]
-	#Refit data
-	scaler = StandardScaler()
-	scaler.fit(DATA)
-
-	#PCA
-	pca = decomposition.PCA(n_components=Cols)
-	pca.fit(scaler.transform(DATA))
-
-	loadings_p = pca.components_[:,:NPCA]
-	loadings_pInv = pca.components_[:NPCA,:]
-	eigenvalues = pca.explained_variance_[:NPCA]
-	theta = [np.sum(pca.explained_variance_[NPCA:]), np.sum(pca.explained_variance_[NPCA:]**2), np.sum(pca.explained_variance_[NPCA:]**3)]
-	
-	#Confidence bounds
-	Data = pd.DataFrame( data = np.zeros((Rows,Cols)), columns = list(df.columns), index=df.index )
-	Variances = pd.DataFrame( data = np.zeros((Rows,Cols)), columns = ["%s" % C for C in range(Cols)], index=df.index )
-	Ts = pd.DataFrame( data = np.zeros((Rows,Cols+1)), columns = ["Ts"] + list(df.columns), index=df.index )
-	Qs = pd.DataFrame( data = np.zeros((Rows,Cols+1)), columns = ["Qs"] + list(df.columns), index=df.index )
-
-	#Look at components contrabution to T and Q statistics
-	VectorTrans = np.zeros(NPCA)
-	VectorRescale = np.zeros(Cols)	
+	Values = df.values.astype(float)
+	Starts, Stops = PCABlocks(Values.shape[0], window)
 
+	Data, Ts, Qs, Variances = PCABuffers(df.shape[0], df.shape[1])
+	PCASegment(Values, NPCA, window, Starts, Stops, Data, Ts, Qs, Variances)
+	return PCAFrames(df, Data, Ts, Qs, Variances)
 
-	#TrackVariances 
-	Variances.iloc[:window, :] = pca.explained_variance_ / np.sum(pca.explained_variance_)
+def PCABlocks(Rows, window):
+	''' Blocks of rows scored by one model fitted on the window before the block. The first block
+	covers the rows up to the window and the model is refitted every PCA_RefitEvery rows after;
+	Rows: Number of rows scored
+	window: The number of points to use in the rolling window
+	Return,
+	Starts: First row of each block
+	Stops: Row after the last of each block
+	'''
+	First = min(window+1, Rows)
+	Starts = np.append(0, np.arange(First, Rows, PCA_RefitEvery))
+	Stops = np.append(Starts[1:], Rows)
+	return Starts, Stops
+
+def PCASegment(Values, NPCA, window, Starts, Stops, Data, Ts, Qs, Variances):
+	''' Score consecutive blocks of rows with the PCA_Engine, writing into the result arrays;
+	Values: The differenced features, shape (Rows, d)
+	NPCA: The dimensionality of the model used, 
+	window: The number of points to use in the rolling window
+	Starts, Stops: Consecutive blocks returned by PCABlocks
+	Data, Ts, Qs, Variances: Arrays returned by PCABuffers for all rows
+	'''
+	if PCA_Engine == "Rolling":
+		PCARolling(Values, NPCA, window, Starts, Stops, Data, Ts, Qs, Variances)
+	elif PCA_Engine == "Batch":
+		PCABatch(Values, NPCA, window, Starts, Stops, Data, Ts, Qs, Variances)
+	else:
+		PCASklearn(Values, NPCA, window, Starts, Stops, Data, Ts, Qs, Variances)
 
-	
-	
-	for H_i in range(Rows):	
-		#Run over all windows...
-		#New Datum
-		dat_i = df.iloc[H_i,:].values.reshape(1, -1)
-			
-		#Check stats w.r.t. old model
-		#Recalc now accepted
-		Rescaledi = scaler.transform(dat_i)
-		Transformedi = pca.transform(Rescaledi)[:,:NPCA]
-		Rescaledi = Rescaledi[0]
-		Transformedi = Transformedi[0]
-
-		#Want PCA returned on Rescaled returned?
-		Data.iloc[H_i,:] = scaler.transform(dat_i)
-		Qi = abs( (Rescaledi.T).dot(Rescaledi) - 
-			np.dot( 
-				np.dot(Transformedi,loadings_pInv).T, 
-				np.dot(Transformedi,loadings_pInv) 
-				) 
-			)
-		Ti = Transformedi.T.dot(np.diag(eigenvalues ** -1)).dot(Transformedi)
-		
+def PCASegmentBounds(Starts, window, NSegments):
+	''' Split the blocks into segments which PCASegment scores exactly as one serial run would.
+	The rolling engine can only start where it recomputes the covariance and the batched engine on a chunk;
+	Starts: First row of each block returned by PCABlocks
+	window: The number of points to use in the rolling window
+	NSegments: Maximum number of segments, of roughly equal rows
+	Return,
+	Bounds: Block index of the start of each segment then the number of blocks
+	'''
+	if PCA_Engine == "Rolling":
+		Valid = np.flatnonzero(RecomputeBlocks(Starts, window))
+	elif PCA_Engine == "Batch":
+		Valid = BatchChunks(Starts, window)
+	else:
+		Valid = np.arange(len(Starts))
+	Targets = np.linspace(0, Starts[-1], NSegments+1)[1:-1]
+	Nearest = Valid[np.argmin(np.abs(Starts[Valid][None,:] - Targets[:,None]), axis=1)]
+	return np.unique(np.concatenate([[0], Nearest, [len(Starts)]]))
+
+def PCASklearn(Values, NPCA, window, Starts, Stops, Data, Ts, Qs, Variances):
+	''' Refit StandardScaler and decomposition.PCA for each block;
+	Values, NPCA, window, Starts, Stops, Data, Ts, Qs, Variances: As PCASegment
+	'''
+	for Start, Stop in zip(Starts, Stops):
+		#Refit using the window before the block
+		End = max(Start, window)
+		DATA = Values[End-window:End]
 
-		#Save data to array
-		Variances.iloc[H_i,:] = pca.explained_variance_ / np.sum(pca.explained_variance_)
-		#Statistics
-		Ts["Ts"].iloc[H_i] = TLimInv(Ti, NPCA, window)
-		Qs["Qs"].iloc[H_i] = QLimInv(Qi, theta)[1]
+		#Refit data
+		scaler = StandardScaler()
+		scaler.fit(DATA)
 
-	
-		#Look at components contrabution to T and Q statistics
-		for i in range(Cols):
-			VectorTrans[:] = 0
-			VectorRescale[:] = 0
-			
-			VectorRescale[i] = scaler.transform(dat_i)[0][i]
-			VectorTrans[:] = pca.transform(VectorRescale.reshape(1,-1))[:,:NPCA][0]
-			
-			TEi = VectorTrans.T.dot(np.diag(eigenvalues ** -1)).dot(VectorTrans)
+		pca = decomposition.PCA(n_components=Values.shape[1])
+		pca.fit(scaler.transform(DATA))
 
-			QEi = abs( (VectorRescale.T).dot(VectorRescale) - 
-				np.dot( 
-				np.dot(VectorTrans,loadings_pInv).T, 
-				np.dot(VectorTrans,loadings_pInv) 
-				) 
-			)
+		#New Data
+		Rescaled = scaler.transform(Values[Start:Stop])
+		Data[Start:Stop] = Rescaled
+		Variances[Start:Stop] = pca.explained_variance_ / np.sum(pca.explained_variance_)
+		Ts[Start:Stop], Qs[Start:Stop] = PCAScores(Rescaled, pca.components_, pca.explained_variance_, NPCA, window, pca.mean_)
 
-			Ts[df.columns[i]].iloc[H_i] = TLimInv(TEi, NPCA, window)
-			Qs[df.columns[i]].iloc[H_i] = QLimInv(QEi, theta)[1]
+#######################
+# Rolling covariance PCA
+#######################
 
-		if H_i < window:
-			continue
+class RollingCovariance:
+	''' Running mean and scatter matrix of the rows in a sliding window, updated as rows are added and removed.
+	'''
+	def __init__(self, Rows):
+		''' Rows: Initial window of rows, shape (n, d)
+		'''
+		self.recompute(Rows)
+
+	def recompute(self, Rows):
+		''' Exact mean and scatter of Rows, discarding rounding errors accumulated by the updates;
+		Rows: Window of rows, shape (n, d)
+		'''
+		self.N = Rows.shape[0]
+		self.Mean = np.mean(Rows, axis=0)
+		Centered = Rows - self.Mean
+		self.Scatter = Centered.T @ Centered
+		self.Updates = 0
+
+	def add(self, x):
+		''' Add a row to the window;
+		x: Row of features
+		'''
+		self.N += 1
+		Delta = x - self.Mean
+		self.Mean = self.Mean + Delta/self.N
+		self.Scatter += np.outer(Delta, x - self.Mean)
+		self.Updates += 1
+
+	def remove(self, x):
+		''' Remove a row from the window;
+		x: Row of features
+		'''
+		self.N -= 1
+		Delta = x - self.Mean
+		self.Mean = self.Mean - Delta/self.N
+		self.Scatter -= np.outer(Delta, x - self.Mean)
+		self.Updates += 1
+
+	def model(self):
+		''' The StandardScaler and decomposition.PCA model of the window;
+		Return,
+		Mean, Scale, Components, Variance: As CovarianceModel
+		'''
+		return CovarianceModel(self.N, self.Mean, self.Scatter)
+
+def CovarianceModel(N, Mean, Scatter):
+	''' The StandardScaler and decomposition.PCA model of windows from their mean and scatter matrix,
+	the scaled covariance is the correlation matrix scaled by n/(n-1) as PCA uses the unbiased variance;
+	N: Number of rows in each window
+	Mean: Feature means, shape (d,) or stacked (w, d)
+	Scatter: Centered sum of outer products, shape (d, d) or stacked (w, d, d)
+	Return,
+	Mean: Feature means
+	Scale: Feature standard deviations, 1 for constant features
+	Components: Principal axes as rows, by decreasing variance
+	Variance: Variance of each component
+	'''
+	Var = np.maximum(np.diagonal(Scatter, axis1=-2, axis2=-1)/N, 0)
+	Scale = np.sqrt(Var)
+	#Constant feature test of StandardScaler
+	Eps = np.finfo(float).eps
+	Scale[Var <= N*Eps*Var + (N*Mean*Eps)**2] = 1
+	Cov = Scatter/(Scale[...,:,None]*Scale[...,None,:])/(N-1)
+	Variance, Vectors = np.linalg.eigh(Cov)
+	return Mean, Scale, np.swapaxes(Vectors[...,::-1], -1, -2), np.maximum(Variance[...,::-1], 0)
+
+def RecomputeBlocks(Starts, window):
+	''' Blocks at which the rolling engine recomputes the covariance of the window exactly rather than
+	updating it, the first block and every block after about PCA_Recompute rows of updates;
+	Starts: First row of each block returned by PCABlocks
+	window: The number of points to use in the rolling window
+	Return,
+	Recompute: Boolean array for each block
+	'''
+	Ends = np.maximum(Starts, window)
+	Recompute = np.ones(len(Starts), dtype=bool)
+	Updates = 0
+	for B_i in range(1, len(Starts)):
+		Step = Ends[B_i] - Ends[B_i-1]
+		if Updates + 2*Step >= 2*PCA_Recompute or Step >= window:
+			Updates = 0
 		else:
-			#Refit using new window
-			DATA = df.iloc[H_i-window+1:H_i+1,:]
+			Updates += 2*Step
+			Recompute[B_i] = False
+	return Recompute
+
+def PCARolling(Values, NPCA, window, Starts, Stops, Data, Ts, Qs, Variances):
+	''' Update a running covariance of the window by each new and oldest row and decompose the small
+	scaled covariance matrix in place of refitting the scaler and PCA;
+	Values, NPCA, window, Starts, Stops, Data, Ts, Qs, Variances: As PCASegment
+	'''
+	Recompute = RecomputeBlocks(Starts, window)
+	for Start, Stop, Exact in zip(Starts, Stops, Recompute):
+		#Model of the window before the block
+		End = max(Start, window)
+		if Exact:
+			Cov = RollingCovariance(Values[End-window:End])
+		else:
+			for H_i in range(Last, End):
+				Cov.add(Values[H_i])
+				Cov.remove(Values[H_i-window])
+		Last = End
+		Mean, Scale, Components, Variance = Cov.model()
 
-			#Refit data
-			scaler = StandardScaler()
-			scaler.fit(DATA)
+		Rescaled = (Values[Start:Stop] - Mean)/Scale
+		Data[Start:Stop] = Rescaled
+		Variances[Start:Stop] = Variance/np.sum(Variance)
+		Ts[Start:Stop], Qs[Start:Stop] = PCAScores(Rescaled, Components, Variance, NPCA, window)
 
-			pca = decomposition.PCA(n_components=Cols)
-			pca.fit(scaler.transform(DATA))
-			loadings_p = pca.components_[:,:NPCA]
-			loadings_pInv = pca.components_[:NPCA,:]
-			eigenvalues = pca.explained_variance_[:NPCA]
-			theta = [np.sum(pca.explained_variance_[NPCA:]), np.sum(pca.explained_variance_[NPCA:]**2), np.sum(pca.explained_variance_[NPCA:]**3)]
+#######################
+# Batched PCA
+#######################
+
+def WindowScatter(X, Starts, W):
+	''' Sums of rows and of their outer products over the windows X[s:s+W] of starts less than W rows apart.
+	Every window is the tail of the rows up to the last start, the rows common to all windows and the head of the
+	rows after them, so outer products are only formed for as many rows as the starts span and not for the window;
+	X: Rows, shape (L, d)
+	Starts: Increasing array of the first row of each window, Starts[-1]-Starts[0] < W, windows must end within X
+	W: Number of rows in each window
+	Return,
+	S1: Window sums, shape (len(Starts), d)
+	S2: Window sums of outer products, shape (len(Starts), d, d)
+	'''
+	First, Last = Starts[0], Starts[-1]+1
+	Outer = lambda Y: Y[:,:,None]*Y[:,None,:]
+	#Rows from each start up to the last start
+	Tail = X[First:Last][::-1]
+	T1 = np.cumsum(Tail, axis=0)[::-1]
+	T2 = np.cumsum(Outer(Tail), axis=0)[::-1]
+	#Rows in every window
+	Common = X[Last:First+W]
+	C1, C2 = np.sum(Common, axis=0), Common.T @ Common
+	#Rows from the end of the first window up to the end of each window
+	Head = X[First+W:Last-1+W]
+	H1 = np.concatenate([np.zeros((1,) + X.shape[1:]), np.cumsum(Head, axis=0)])
+	H2 = np.concatenate([np.zeros((1,) + X.shape[1:]*2), np.cumsum(Outer(Head), axis=0)])
+	i = Starts - First
+	return T1[i] + C1 + H1[i], T2[i] + C2 + H2[i]
+
+def BatchChunks(Starts, window):
+	''' First block of each chunk decomposed together by the batched engine. A chunk covers about PCA_BatchChunk
+	rows and its windows start less than a window apart, so its memory is set by the chunk and not the window;
+	Starts: First row of each block returned by PCABlocks
+	window: The number of points to use in the rolling window
+	Return,
+	Firsts: Block index of the start of each chunk
+	'''
+	PerChunk = max(1, PCA_BatchChunk//PCA_RefitEvery)
+	Lo = np.maximum(Starts, window) - window
+	Firsts = [0]
+	while True:
+		Next = min(Firsts[-1]+PerChunk, np.searchsorted(Lo, Lo[Firsts[-1]]+window, side="left"))
+		if Next >= len(Starts):
+			return np.array(Firsts)
+		Firsts.append(Next)
+
+def PCABatch(Values, NPCA, window, Starts, Stops, Data, Ts, Qs, Variances):
+	''' For offline runs, build every window's scatter matrix from running sums of outer products
+	and decompose a chunk of windows in one batched eigh call;
+	Values, NPCA, window, Starts, Stops, Data, Ts, Qs, Variances: As PCASegment
+	'''
+	Firsts = BatchChunks(Starts, window)
+	for C_i, C_j in zip(Firsts, np.append(Firsts[1:], len(Starts))):
+		Start, Stop = Starts[C_i:C_j], Stops[C_i:C_j]
+		Lo = np.maximum(Start, window) - window
+		#Shift by the chunk mean so the scatter is not a small difference of large sums
+		X = Values[Lo[0]:Lo[-1]+window]
+		Shift = np.mean(X, axis=0)
+		S1, S2 = WindowScatter(X - Shift, Lo-Lo[0], window)
+		Mean, Scale, Components, Variance = CovarianceModel(window, S1/window + Shift, S2 - S1[:,:,None]*S1[:,None,:]/window)
+
+		#Model of each row
+		Model = np.repeat(np.arange(len(Start)), Stop-Start)
+		Rescaled = (Values[Start[0]:Stop[-1]] - Mean[Model])/Scale[Model]
+		Data[Start[0]:Stop[-1]] = Rescaled
+		Variances[Start[0]:Stop[-1]] = (Variance/np.sum(Variance, axis=1, keepdims=True))[Model]
+		Ts[Start[0]:Stop[-1]], Qs[Start[0]:Stop[-1]] = PCAScores(Rescaled, Components[:,:NPCA][Model], Variance[Model], NPCA, window)
 
-	return Data, Ts, Qs, Variances
-			
 if __name__ == "__main__":
 	print("Run as module") 
@@ -0,0 +1,89 @@
+"""============================================================================
+Module of vectorised distribution functions used for the confidence limits.
+Each takes arrays or values and evaluates element wise in closed form.
+
+Contents:
+- Normal
+- F distribution
+
+Author: Joseph Walker j.j.walker@durham.ac.uk
+============================================================================"""
+import numpy as np
+import scipy.special
+
+################################################################################################################
+# Functions:
+################################################################################################################
+
+#######################
+# Normal
+#######################
+
+def NormCdf(x, Mean=0, SD=1):
+	''' Normal cumulative distribution function;
+	x: array or value to evaluate
+	Mean: Gaussian center
+	SD: Standard Deviation
+	Return,
+	P: Probability below x
+	'''
+	return scipy.special.ndtr((np.asarray(x)-Mean)/SD)
+
+def NormSf(x, Mean=0, SD=1):
+	''' Normal survival function, accurate far into the upper tail;
+	x: array or value to evaluate
+	Mean: Gaussian center
+	SD: Standard Deviation
+	Return,
+	P: Probability above x
+	'''
+	return scipy.special.ndtr(-(np.asarray(x)-Mean)/SD)
+
+def NormInterval(Xmin, Xmax, Mean=0, SD=1):
+	''' Normal probability between limits, taken from whichever tail is smaller;
+	Xmin: Lower limit
+	Xmax: Upper limit
+	Mean: Gaussian center
+	SD: Standard Deviation
+	Return,
+	P: Probability between Xmin and Xmax
+	'''
+	Upper = (np.asarray(Xmin)-Mean)/SD > 0
+	return np.where(Upper, NormSf(Xmin, Mean, SD) - NormSf(Xmax, Mean, SD), NormCdf(Xmax, Mean, SD) - NormCdf(Xmin, Mean, SD))
+
+#######################
+# F distribution
+#######################
+
+def FCdf(x, dfn, dfd):
+	''' F distribution cumulative distribution function;
+	x: array or value to evaluate
+	dfn: Numerator degrees of freedom
+	dfd: Denominator degrees of freedom
+	Return,
+	P: Probability below x
+	'''
+	return scipy.special.fdtr(dfn, dfd, np.clip(x, 0, None))
+
+def FSf(x, dfn, dfd):
+	''' F distribution survival function;
+	x: array or value to evaluate
+	dfn: Numerator degrees of freedom
+	dfd: Denominator degrees of freedom
+	Return,
+	P: Probability above x
+	'''
+	return scipy.special.fdtrc(dfn, dfd, np.clip(x, 0, None))
+
+def FPpf(q, dfn, dfd):
+	''' F distribution percent point function, inverse of FCdf;
+	q: array or value of probabilities
+	dfn: Numerator degrees of freedom
+	dfd: Denominator degrees of freedom
+	Return,
+	x: Value with probability q below it
+	'''
+	return scipy.special.fdtri(dfn, dfd, q)
+
+if __name__ == "__main__":
+	print("Run as module")
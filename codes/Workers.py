@@ -0,0 +1,332 @@
+"""============================================================================
+Module running the "Run all" anaylsis over a pool of worker processes. Each
+worker loads its own features and writes its own output files so results
+are collected as they finish.
+
+Contents:
+- Settings
+- Alpha workers
+- Alpha chunks
+- BOCPD workers
+- PCA segments
+- Pool
+
+Author: Joseph Walker j.j.walker@durham.ac.uk
+============================================================================"""
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import os
+import sys
+if sys.argv[0] == "JustRun.py":
+	from EDFApp.codes import DatManipulation as DatM
+	from EDFApp.codes import Fourier
+	from EDFApp.codes import BOCPD
+	from EDFApp.codes import Misc
+	from EDFApp.codes import CalcStats
+	from EDFApp.codes import PCA
+if sys.argv[0].split(os.sep)[-1] == "app.py":
+	from codes import DatManipulation as DatM
+	from codes import Fourier
+	from codes import BOCPD
+	from codes import Misc
+	from codes import CalcStats
+	from codes import PCA
+
+#NWorkers: Number of worker processes, 0 for all cores
+NWorkers = 0
+#Window settings used by the Alpha anaylsis
+WindowUnit = "week"
+WindowN = 1
+#BOCPD settings used by the run all anaylsis
+BOCPD_errsScale = 1
+BOCPD_MaxHypotheses = 0
+#Alpha_BurnIn: Windows fitted before each chunk of a single series to re-establish the warm start
+Alpha_BurnIn = 50
+#Alpha_MinChunk: Fewest windows worth sending to a worker process
+Alpha_MinChunk = 1024
+#PCA_MinSegment: Fewest rows worth sending to a worker process
+PCA_MinSegment = 4096
+
+################################################################################################################
+# Functions:
+################################################################################################################
+
+#######################
+# Settings
+#######################
+
+def CollectSettings():
+	''' Module level hyperparameters set by the dashboard, to be copied into each worker.
+	Return,
+	Settings: Dictionary {module name: {parameter: value}}
+	'''
+	Settings = {}
+	for Module, Names in [
+			[Fourier, ["Alpha_MinFreq", "Alpha_Spectrum", "Alpha_SDFTAnchor", "Alpha_AnalyticFit", "Alpha_Estimator", "Alpha_NBins", "Alpha_Hop", "Alpha_HopFill", "Alpha_Engine", "Alpha_WaveletMinBlocks", "Alpha_LMMaxIter"]],
+			[BOCPD, ["BOCPD_tol", "BOCPD_MaxSeqLength", "BOCPD_hazard", "BOCPD_haz", "BOCPD_LogSpace"]],
+			[PCA, ["PCA_Engine", "PCA_Recompute", "PCA_RefitEvery", "PCA_BatchChunk", "PCA_Float32"]],
+			[DatM, ["FileSuffix"]],
+			[sys.modules[__name__], ["WindowUnit", "WindowN", "BOCPD_errsScale", "BOCPD_MaxHypotheses"]],
+		]:
+		Settings[Module.__name__] = {Name: getattr(Module, Name) for Name in Names if hasattr(Module, Name)}
+	return Settings
+
+def InitWorker(Settings):
+	''' Worker initializer applying the dashboard hyperparameters.
+	Settings: Dictionary returned by CollectSettings
+	'''
+	for ModuleName, Values in Settings.items():
+		Module = sys.modules[ModuleName]
+		for Name, Value in Values.items():
+			setattr(Module, Name, Value)
+
+#######################
+# Alpha workers
+#######################
+
+def AlphaWorker(RawDir, AlphaDir, Data_i_Name):
+	''' Run the Alpha anaylsis of one feature and save it.
+	RawDir: Raw data directory
+	AlphaDir: Alpha data directory
+	Data_i_Name: Feature name
+	Return,
+	Data_i_Name: Feature name
+	'''
+	data = DatM.LoadData(RawDir, Data_i_Name)
+	# Statistics of interest
+	WindowParameters = CalcStats.CalcStats(data[Data_i_Name])
+	units = Misc.CalcUnits(WindowParameters["Rate"],WindowParameters["RateUnit"])
+	window = Misc.WindowSize(WindowParameters["Rate"], WindowParameters["RateUnit"], WindowUnit, WindowN)
+	#Error estimated on mean devition beween points
+	errs = Misc.errCalculation(data, WindowParameters["RateUnit"], True)
+	Alphasdf = Fourier.AlphasProgress(data[Data_i_Name].values, window, errs, units, Data_i_Name)
+	Alphasdf.index = data.index
+	writer = pd.ExcelWriter("%s%s%s.xlsx" % (AlphaDir, os.sep, Data_i_Name), mode="w")
+	Alphasdf.to_excel(writer)
+	writer.save()
+	#Checkpoint matching UpdateAlphas so the tab only fits rows appended later
+	DatM.SaveState(AlphaDir, Data_i_Name, Fourier.AlphasState(data[Data_i_Name].values, window, errs, units, data.index[-1]))
+	return Data_i_Name
+
+#######################
+# Alpha chunks
+#######################
+
+def AlphaChunkWorker(data, WinSize, errs, units, BurnIn):
+	''' Fit every Fourier.Alpha_Hop-th window of a slice of a series, dropping the burn in windows.
+	data: Slice of raw data covering the chunk and its burn in
+	WinSize: Int number of data points in the window
+	errs: errors on the amplitudes
+	units: convert to appropiate units
+	BurnIn: Number of leading fitted windows to drop
+	Return,
+	PinkWindows: Array of [PPink, PPinkErrs] for each fitted window of the chunk
+	'''
+	return Fourier.AlphasWindows(data, WinSize, errs, units, 0, len(data)-WinSize+1, Hop=Fourier.Alpha_Hop)[BurnIn:]
+
+def AlphasProgressParallel(data, WinSize, errs, units, Name):
+	''' Fourier.AlphasProgress of a single series split into chunks of windows run over a pool of worker processes.
+	Each chunk first fits up to Alpha_BurnIn earlier windows so the warm start matches the serial run.
+	data: Raw data of variable
+	WinSize: Int number of data points in the window
+	errs: errors on the amplitudes
+	units: convert to appropiate units
+	Name: The varible name
+	Return,
+	df: Dataframe of rolling window Alphas and fitting errors
+	'''
+	NPoints = len(data)
+	NWindows = NPoints-WinSize
+	NChunks = min(Workers(), NWindows//Alpha_MinChunk)
+	#The wavelet engine is linear in the data length
+	if NChunks <= 1 or Fourier.Alpha_Engine == "Wavelet":
+		return Fourier.AlphasProgress(data, WinSize, errs, units, Name)
+
+	#Chunks start on fitted windows
+	Hop = Fourier.Alpha_Hop
+	Bounds = np.round(np.linspace(0, NWindows, NChunks+1)/Hop).astype(int)*Hop
+	Bounds[-1] = NWindows
+	Jobs = []
+	for Start, Stop in zip(Bounds[:-1], Bounds[1:]):
+		First = max(0, Start-Alpha_BurnIn*Hop)
+		Jobs.append([data[First:Stop-1+WinSize], WinSize, errs, units, (Start-First)//Hop])
+	PinkWindows = np.zeros((NPoints,2, 2)) - np.inf
+	PinkWindows[WinSize:] = np.nan
+	with ProcessPoolExecutor(max_workers=NChunks, initializer=InitWorker, initargs=(CollectSettings(),)) as Pool:
+		Chunks = Pool.map(AlphaChunkWorker, *zip(*Jobs))
+		for Start, Stop, Rows in zip(Bounds[:-1], Bounds[1:], Chunks):
+			PinkWindows[Start+WinSize:Stop+WinSize:Hop] = Rows
+	return Fourier.AlphasFrame(PinkWindows, Name)
+
+#######################
+# BOCPD workers
+#######################
+
+def BOCPDWorker(RawDir, BOCPDDirectory, Names):
+	''' Run the BOCPD anaylsis of a group of features and save them, features of equal length are run together.
+	RawDir: Raw data directory
+	BOCPDDirectory: BOCPD data directory
+	Names: List of feature names
+	Return,
+	Names: List of feature names
+	'''
+	Groups = {}
+	for Data_i_Name in Names:
+		data = DatM.LoadData(RawDir, Data_i_Name)
+		WindowParameters = CalcStats.CalcStats(data)
+		#Error estimated on mean devition beween points
+		Errors = Misc.errCalculation(data, WindowParameters["RateUnit"], False)
+		errs = np.sqrt(Errors[1:]**2+Errors[:-1]**2)
+		Groups.setdefault(data.shape[0], []).append([Data_i_Name, data.index[1:], data[Data_i_Name].diff(1).values[1:], BOCPD_errsScale*errs, data[Data_i_Name].values[-1], Errors[-1]])
+
+	for Group in Groups.values():
+		Discardeds = [None for G in Group]
+		if BOCPD_MaxHypotheses > 0:
+			#Fixed budget approximation
+			Rs, R_Maxs, Pss, Discardeds = zip(*[BOCPD.bocdBeam(G[2], G[3], BOCPD_MaxHypotheses, Dense=False) for G in Group])
+		else:
+			Rs, R_Maxs, Pss = BOCPD.bocdBatch(np.array([G[2] for G in Group]), np.array([G[3] for G in Group]), Dense=False)
+
+		for G, R, R_Max, Ps, Discarded in zip(Group, Rs, R_Maxs, Pss, Discardeds):
+			Data_i_Name, Index = G[0], G[1]
+			#Checkpoint matching UpdateBOCPD so the tab only processes rows appended later
+			State = BOCPD.OnlineBOCPD.from_posterior(R, G[2], G[3]).state()
+			State["LastTime"] = "%s" % Index[-1]
+			State["LastValue"] = float(G[4])
+			State["LastError"] = float(G[5])
+
+			BOCPDdf = pd.DataFrame(BOCPD.DenseTruncated(R), index=Index)
+			writer = pd.ExcelWriter("%s%s%s.xlsx" % (BOCPDDirectory, os.sep, Data_i_Name), mode="w")
+			BOCPDdf.to_excel(writer)
+			writer.save()
+
+			Rmaxdf = pd.DataFrame(data={"R_Max":R_Max, "P":Ps}, index=Index)
+			if Discarded is not None:
+				Rmaxdf["Discarded"] = Discarded
+			writer = pd.ExcelWriter("%s%s%s_R_Max.xlsx" % (BOCPDDirectory, os.sep, Data_i_Name), mode="w")
+			Rmaxdf.to_excel(writer)
+			writer.save()
+			DatM.RemoveAppended(BOCPDDirectory, Data_i_Name)
+			DatM.RemoveAppended(BOCPDDirectory, Data_i_Name+"_R_Max")
+			DatM.SaveState(BOCPDDirectory, Data_i_Name, State)
+	return Names
+
+#######################
+# PCA segments
+#######################
+
+def SharedArray(Array):
+	''' Copy an array into a new shared memory block;
+	Array: Array to share
+	Return,
+	shm: The shared memory block, to be closed and unlinked by the caller
+	View: Array backed by the block
+	Spec: [name, shape, dtype] to attach to it from another process
+	'''
+	shm = shared_memory.SharedMemory(create=True, size=max(Array.nbytes, 1))
+	View = np.ndarray(Array.shape, dtype=Array.dtype, buffer=shm.buf)
+	View[...] = Array
+	return shm, View, [shm.name, Array.shape, Array.dtype.str]
+
+def PCASegmentWorker(Specs, NPCA, window, First, Last):
+	''' Score a segment of PCA.PCABlocks straight into the shared result arrays. The shared
+	differenced features give the worker the window of rows before its segment.
+	Specs: [name, shape, dtype] of the shared Values, Data, Ts, Qs and Variances arrays
+	NPCA: The dimensionality of the model used, 
+	window: The number of points to use in the rolling window
+	First: First block of the segment
+	Last: Block after the segment
+	Return,
+	First: First block of the segment
+	'''
+	Shms = [shared_memory.SharedMemory(name=Spec[0]) for Spec in Specs]
+	try:
+		Values, Data, Ts, Qs, Variances = [np.ndarray(Spec[1], dtype=Spec[2], buffer=shm.buf) for Spec, shm in zip(Specs, Shms)]
+		Starts, Stops = PCA.PCABlocks(Values.shape[0], window)
+		PCA.PCASegment(Values, NPCA, window, Starts[First:Last], Stops[First:Last], Data, Ts, Qs, Variances)
+		del Values, Data, Ts, Qs, Variances
+	finally:
+		for shm in Shms:
+			shm.close()
+	return First
+
+def PCAParallel(df, NPCA, window):
+	''' PCA.PCA split into segments of blocks run over a pool of worker processes. Segments start where
+	the engine starts afresh so the output is identical to the serial run.
+	df: The dataframe containing all our features over time.
+	NPCA: The dimensionality of the model used, 
+	window: The number of points to use in the rolling window
+	Return,
+	Data: Scaled variables
+	Ts: The t squared hotelling statistic df. Overall and individual
+	Qs: The Q resisduals statistic df. Overall and individual
+	Variances: The fractional variance in each component over time
+	'''
+	Diffed = df.diff(1).iloc[1:,:]
+	Rows, Cols = Diffed.shape[0], Diffed.shape[1]
+	NSegments = min(Workers(), Rows//PCA_MinSegment)
+	if NSegments <= 1:
+		return PCA.PCA(df, NPCA, window)
+	Starts, _ = PCA.PCABlocks(Rows, window)
+	Bounds = PCA.PCASegmentBounds(Starts, window, NSegments)
+	if len(Bounds) <= 2:
+		return PCA.PCA(df, NPCA, window)
+
+	Shared = [SharedArray(A) for A in [Diffed.values.astype(float)] + list(PCA.PCABuffers(Rows, Cols))]
+	try:
+		Specs = [Spec for _, _, Spec in Shared]
+		N = len(Bounds)-1
+		with ProcessPoolExecutor(max_workers=N, initializer=InitWorker, initargs=(CollectSettings(),)) as Pool:
+			list(Pool.map(PCASegmentWorker, [Specs]*N, [NPCA]*N, [window]*N, Bounds[:-1], Bounds[1:]))
+		Results = [View.copy() for _, View, _ in Shared[1:]]
+	finally:
+		Shared = [shm for shm, _, _ in Shared]
+		for shm in Shared:
+			shm.close()
+			shm.unlink()
+	return PCA.PCAFrames(Diffed, *Results)
+
+#######################
+# Pool
+#######################
+
+def Workers():
+	''' Number of worker processes to use.
+	Return,
+	N: int
+	'''
+	if NWorkers > 0:
+		return NWorkers
+	return os.cpu_count() or 1
+
+def Chunks(Names, NChunks):
+	''' Split a list of feature names into at most NChunks contiguous lists.
+	Names: List of feature names
+	NChunks: Number of lists
+	Return,
+	Chunks: List of lists of feature names
+	'''
+	N = min(NChunks, len(Names))
+	Bounds = np.linspace(0, len(Names), N+1).astype(int)
+	return [Names[Bounds[i]:Bounds[i+1]] for i in range(N)]
+
+def RunPool(Function, Jobs):
+	''' Run Function over Jobs in a pool of worker processes, collecting results as they finish.
+	Function: Top level function to run
+	Jobs: List of argument lists
+	Return,
+	Results: List of results in order of completion
+	'''
+	Results = []
+	with ProcessPoolExecutor(max_workers=Workers(), initializer=InitWorker, initargs=(CollectSettings(),)) as Pool:
+		Futures = [Pool.submit(Function, *Job) for Job in Jobs]
+		for Future in as_completed(Futures):
+			Results.append(Future.result())
+			print("Completed %s/%s: %s" % (len(Results), len(Jobs), Results[-1]))
+	return Results
+
+if __name__ == "__main__":
+	print("Run as module")
@@ -1 +1 @@
-__all__ = ["DatManipulation", "Fourier","BOCPD", "PCA", "Misc", "Graphing", "DashPlots", "CalcStats"]
+__all__ = ["DatManipulation", "Fourier","BOCPD", "PCA", "Misc", "Graphing", "DashPlots", "CalcStats", "Workers", "Stats"]